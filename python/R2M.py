@@ -20,6 +20,9 @@ from os import walk, sep, system, makedirs, getcwd, remove
 from os.path import basename, isdir
 from optparse import OptionParser
 from shutil import rmtree
+from multiprocessing import cpu_count
+
+import mssort
 
 
 
@@ -173,14 +176,18 @@ def runScart(msPath,sdsPath):
 '''
 DataSelect
 '''
-def runDataselect(sdsPath):
+def runDataselect(sdsPath, jobs = 1):
 
-    print "now, running datadelect to sort files ..."
+    print "now, sorting files ..."
 
-    for root, dirs, files in walk(sdsPath):
-        for file in files:
-            sdsFile = root+sep+file
-            system("dataselect -Pr -rep -mod -nb %s" % sdsFile)
+    #
+    ## Native sorter (was dataselect -Pr -rep -mod -nb on every file),
+    ## files already in order are only scanned
+    for (sdsFile, result, error) in mssort.sort_files(mssort.iter_files([sdsPath]), jobs):
+        if error is not None:
+            print "cannot sort %s (%s)" % (sdsFile, error)
+        elif result[2]:
+            print sdsFile, "sorted, %d duplicates removed" % result[1]
 
     print "... done!"
 
@@ -201,6 +208,7 @@ def make_cmdline_parser():
     # parser.add_option("-r", "--rate", dest="rate", help="Station Sampling Rate, e.g. 100 for 100Hz", default=None)
     parser.add_option("", "--not-oriented", action="store_true", dest="cha_naming", help="Channel naming, use this option to use [Z,1,2] instead of [Z,N,E]", default=False)
     parser.add_option("", "--scart", action="store_true", dest="scart", help="Run SeisComP3 Scart to create SDS locally", default=False)
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", help="Number of processes sorting the SDS files. Default is the number of CPUs", default=cpu_count())
 
 
     return parser
@@ -238,7 +246,7 @@ if __name__ == "__main__":
         _sdsName = ".".join(('SDS',basename(stream)))
         _sdsPath = "/".join((getcwd(),_sdsName))
         runScart(_msPath,_sdsPath)
-        runDataselect(_sdsPath)
+        runDataselect(_sdsPath, options.jobs)
 
 
     sys.exit(0)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_parse_log.py — micro-benchmarks do parse_log.py (corpus sintético)
+
+Uso:
+  python3 bench_parse_log.py                 # todos os benchmarks
+  python3 bench_parse_log.py soh -n 1000000  # só o classificador SOH
+  python3 bench_parse_log.py clock           # estatística ON/OFF do clock externo
+  python3 bench_parse_log.py events          # junção EH+ET → df_evt
+  python3 bench_parse_log.py time            # parse de tempos RT130 (LRU / vetorizado)
+
+Cada benchmark imprime o throughput "antes" (implementação de referência)
+e "depois" (implementação atual) sobre o mesmo corpus.
+"""
+
+import random
+import time
+
+import parse_log
+
+
+# -----------------------------------------------------------
+# Corpus sintético
+# -----------------------------------------------------------
+
+# Mistura aproximada de um SH real: poucas métricas, muita mensagem livre
+# (que não casa com nenhuma regex de métrica).
+_SOH_TEMPLATES = [
+    (10, lambda r: "BATTERY VOLTAGE = %.1fV, TEMPERATURE = %dC, BACKUP = 03.3V"
+         % (12 + 2 * r.random(), r.randint(-5, 40))),
+    (10, lambda r: "GPS: POSITION: S23:33:%05.2f W046:43:12.00 +00750M" % (10 * r.random())),
+    (2, lambda r: "MEMORY USED=%d, AVAILABLE=%d, TOTAL=4096" % (r.randint(0, 4096), r.randint(0, 4096))),
+    (2, lambda r: "DISK 1*: USED: %d AVAIL: 3920000 TOTAL: 3920000 CL: 32K" % r.randint(0, 3920000)),
+    (1, lambda r: "BVTC BW B: 123UV NOM, V: 456UV CAL, T: 300.5MK CAL, C: 789UV CAL"),
+    (8, lambda r: "EXTERNAL CLOCK POWER IS TURNED %s" % r.choice(("ON", "OFF"))),
+    (2, lambda r: "AUTO DUMP CALLED"),
+    (2, lambda r: "ACQUISITION STARTED"),
+    (2, lambda r: "RTP: FORCING DISCOVERY SLEEP FOR:%d SECONDS" % r.randint(1, 60)),
+    (20, lambda r: "INTERNAL CLOCK PHASE ERROR OF %d USECONDS" % r.randint(0, 999)),
+    (15, lambda r: "GPS: V%d.%02d" % (r.randint(1, 9), r.randint(0, 99))),
+    (15, lambda r: "EXTERNAL CLOCK IS UNLOCKED"),
+    (11, lambda r: "DSP CLOCK SET: OLD=%d, NEW=%d" % (r.randint(0, 10**6), r.randint(0, 10**6))),
+]
+
+
+def make_soh_messages(n, seed=1):
+    """
+    Gera `n` mensagens SOH (já sem o timestamp da linha).
+    """
+    r = random.Random(seed)
+    weights = [w for w, _ in _SOH_TEMPLATES]
+    makers = [f for _, f in _SOH_TEMPLATES]
+    # pool fixo reaproveitado: o custo medido é o da classificação, não o do gerador
+    pool = [r.choices(makers, weights)[0](r) for _ in range(min(n, 50000))]
+    return [pool[i % len(pool)] for i in range(n)]
+
+
+def make_clock_events(n, seed=1):
+    """
+    DataFrame de eventos SOH com `n` transições EXTERNAL CLOCK POWER ON/OFF
+    (intervalos de ~1 min, com repetições de estado).
+    """
+    import numpy as np
+    import pandas as pd
+    r = np.random.default_rng(seed)
+    t = np.datetime64("2025-01-01T00:00:00", "ns") + np.cumsum(r.integers(1, 120, n)).astype("timedelta64[s]")
+    return pd.DataFrame({
+        "type": "external_clock_power",
+        "state": r.choice(np.array(["ON", "OFF"], dtype=object), n, p=[0.6, 0.4]),
+    }, index=pd.DatetimeIndex(t, name="time"))
+
+
+def make_time_strings(n, repeat=4, seed=1):
+    """
+    `n` tempos 'YYYY:JJJ:HH:MM:SS:USEC' em ordem, cada um repetido ~`repeat`
+    vezes (como cabeçalhos/linhas no mesmo segundo).
+    """
+    r = random.Random(seed)
+    out = []
+    t = 0
+    while len(out) < n:
+        t += r.randint(1, 120)
+        s = "2025:%03d:%02d:%02d:%02d:000000" % (1 + t // 86400 % 365, t // 3600 % 24, t // 60 % 60, t % 60)
+        out.extend([s] * r.randint(1, 2 * repeat - 1))
+    return out[:n]
+
+
+def iter_event_blocks(n_events, streams=3, seed=1):
+    """
+    Blocos EH/ET já parseados (como em dados_raw), `streams` por evento.
+    """
+    r = random.Random(seed)
+    t = 0
+    for ev in range(1, n_events + 1):
+        t += r.randint(10, 600)
+        t0 = "2025:%03d:%02d:%02d:%02d:000000" % (1 + t // 86400 % 365, t // 3600 % 24, t // 60 % 60, t % 60)
+        t1 = "2025:%03d:%02d:%02d:%02d:000000" % (1 + (t + 60) // 86400 % 365, (t + 60) // 3600 % 24,
+                                                  (t + 60) // 60 % 60, (t + 60) % 60)
+        for st in range(1, streams + 1):
+            common = {"event": str(ev), "stream": str(st), "sample rate": "100",
+                      "trigger type": "EVT", "trigger time": t0}
+            eh = {"kind": "EH", "time": t0, "das": 9775, "seq": 2 * st, "event_id": ev,
+                  "fields": dict(common, **{"stream name": "STREAM%d" % st, "format": "32"})}
+            et = {"kind": "ET", "time": t0, "das": 9775, "seq": 2 * st + 1, "event_id": ev,
+                  "fields": dict(common, **{"first sample": t0, "last sample": t1}),
+                  "extra_lines": ["DAS: 9775 EV: %04d DS: %d FST = %s TT = %s NS: 6000 SPS: 100 ETO: 0"
+                                  % (ev, st, t0, t0)]}
+            yield eh
+            yield et
+
+
+def make_event_blocks(n_events, streams=3, seed=1):
+    return list(iter_event_blocks(n_events, streams, seed))
+
+
+# -----------------------------------------------------------
+# Referências (implementações antigas)
+# -----------------------------------------------------------
+
+def _join_event_reference(ev_id, stream, eh, et):
+    import re
+    f_eh = eh.get("fields", {})
+    f_et = et.get("fields", {})
+
+    try:
+        eh_time = parse_log.parse_rt130_time(eh["time"])
+    except Exception:
+        eh_time = None
+
+    def _safe(s):
+        if not s:
+            return None
+        try:
+            return parse_log.parse_rt130_time(s)
+        except Exception:
+            return None
+
+    trigger_time = _safe(f_eh.get("trigger time") or f_et.get("trigger time"))
+    first_sample = _safe(f_et.get("first sample"))
+    last_sample = _safe(f_et.get("last sample"))
+
+    duration_s = None
+    if first_sample and last_sample:
+        duration_s = (last_sample - first_sample).total_seconds()
+
+    ns = sps = eto = None
+    for line in et.get("extra_lines", []):
+        if "NS:" in line and "SPS:" in line:
+            m_ns = re.search(r"NS:\s+(\d+)", line)
+            m_sps = re.search(r"SPS:\s+([0-9.]+)", line)
+            m_eto = re.search(r"ETO:\s+(\d+)", line)
+            if m_ns:
+                ns = int(m_ns.group(1))
+            if m_sps:
+                sps = float(m_sps.group(1))
+            if m_eto:
+                eto = int(m_eto.group(1))
+            break
+
+    sample_rate = None
+    if "sample rate" in f_eh:
+        try:
+            sample_rate = float(f_eh["sample rate"])
+        except Exception:
+            sample_rate = None
+    elif "sample rate" in f_et:
+        try:
+            sample_rate = float(f_et["sample rate"])
+        except Exception:
+            sample_rate = None
+
+    return {
+        "event": ev_id, "stream": stream, "stream_name": f_eh.get("stream name"),
+        "trigger_type": f_eh.get("trigger type"), "sample_rate": sample_rate, "eh_time": eh_time,
+        "trigger_time": trigger_time, "first_sample": first_sample, "last_sample": last_sample,
+        "duration_s": duration_s, "nsamples": ns, "sps": sps, "eto": eto,
+        "seq_eh": eh.get("seq"), "seq_et": et.get("seq"), "das": eh.get("das", et.get("das")),
+        "raw_eh": eh, "raw_et": et,
+    }
+
+
+def build_events_reference(blocks):
+    """
+    Referência: build_events + events_model_to_frame antes da otimização
+    (regex inline, 4 parse de tempo por evento, df a partir de dicts).
+    """
+    import pandas as pd
+    from datetime import datetime
+    eh_by_ev = {}
+    et_by_key = {}
+    for b in blocks:
+        stream = int(b["fields"]["stream"])
+        if b["kind"] == "EH":
+            eh_by_ev.setdefault(b["event_id"], {})[stream] = b
+        else:
+            et_by_key[(b["event_id"], stream)] = b
+    by_id = {}
+    for ev_id, streams in eh_by_ev.items():
+        for stream, eh in streams.items():
+            et = et_by_key.get((ev_id, stream))
+            if et is not None:
+                by_id[(ev_id, stream)] = _join_event_reference(ev_id, stream, eh, et)
+    by_time = sorted(by_id.values(), key=lambda e: e["first_sample"] or datetime.min)
+    cols = ["first_sample", "last_sample", "trigger_time", "event", "stream", "stream_name", "trigger_type",
+            "sample_rate", "duration_s", "nsamples", "sps", "eto", "das"]
+    rows = [dict((c, e.get(c)) for c in cols) for e in by_time]
+    return pd.DataFrame(rows).sort_values("first_sample").set_index("first_sample")
+
+
+def compute_external_clock_stats_loop(df_soh_events):
+    """
+    Referência: compute_external_clock_stats antes da vetorização
+    (laços Python sobre to_pydatetime / .iloc).
+    """
+    import numpy as np
+    if df_soh_events is None or len(df_soh_events) == 0:
+        return None
+
+    clk = df_soh_events[df_soh_events.get("type") == "external_clock_power"].copy()
+    if len(clk) == 0:
+        return None
+
+    clk = clk.sort_index()
+    # mapeia state -> 1/0
+    def _map_state(s):
+        if s == "ON":
+            return 1
+        if s == "OFF":
+            return 0
+        return None
+
+    clk["state01"] = [ _map_state(x) for x in clk.get("state") ]
+    # diffs
+    t = clk.index.to_pydatetime()
+    dt_s = []
+    for i in range(len(t) - 1):
+        dt_s.append((t[i+1] - t[i]).total_seconds())
+    # atribui dt ao estado do intervalo (estado na linha i)
+    on_s = off_s = 0.0
+    for i, dts in enumerate(dt_s):
+        st = clk["state01"].iloc[i]
+        if st == 1:
+            on_s += dts
+        elif st == 0:
+            off_s += dts
+
+    total = on_s + off_s
+    frac_off = (off_s / total) if total > 0 else None
+    frac_on = (on_s / total) if total > 0 else None
+
+    # estatística dos intervalos entre eventos (toggle period)
+    if dt_s:
+        dt_arr = np.array(dt_s, dtype=float)
+        stats = {
+            "interval_mean_s": float(dt_arr.mean()),
+            "interval_median_s": float(np.median(dt_arr)),
+            "interval_min_s": float(dt_arr.min()),
+            "interval_max_s": float(dt_arr.max()),
+        }
+    else:
+        stats = {}
+
+    out = {
+        "n_events": int(len(clk)),
+        "on_s": float(on_s),
+        "off_s": float(off_s),
+        "frac_on": frac_on,
+        "frac_off": frac_off,
+    }
+    out.update(stats)
+    return out
+
+
+# -----------------------------------------------------------
+# Helpers
+# -----------------------------------------------------------
+
+def _timeit(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def _report(name, n, unit, t_before, t_after):
+    print("%-28s n=%-9d before: %10.0f %s/s   after: %10.0f %s/s   (x%.2f)" % (
+        name, n, n / t_before, unit, n / t_after, unit, t_before / t_after))
+
+
+# -----------------------------------------------------------
+# Benchmarks
+# -----------------------------------------------------------
+
+def bench_soh_classifier(n=1000000):
+    """
+    apply_soh_message (classificador em uma passada) vs
+    apply_soh_message_sequential (até 5 .search por linha).
+    """
+    msgs = make_soh_messages(n)
+
+    def run(apply):
+        for msg in msgs:
+            apply({}, msg)
+
+    t_before = _timeit(run, parse_log.apply_soh_message_sequential)
+    t_after = _timeit(run, parse_log.apply_soh_message)
+    _report("soh_classifier", n, "lines", t_before, t_after)
+
+
+def bench_external_clock(n=1000000):
+    """
+    compute_external_clock_stats vetorizado vs laço Python (referência).
+    """
+    df = make_clock_events(n)
+    t_before = _timeit(compute_external_clock_stats_loop, df)
+    t_after = _timeit(parse_log.compute_external_clock_stats, df)
+    _report("external_clock_stats", n, "trans", t_before, t_after)
+
+
+def bench_events(n=90000):
+    """
+    Junção EH+ET → df_evt: referência vs build_events (extratores
+    pré-compilados, cache de tempos, tabela colunar). `n` = nº de eventos
+    (3 streams cada). Também mede a memória retida pelo modelo com/sem
+    raw_eh/raw_et (blocos em streaming).
+    """
+    import tracemalloc
+    blocks = make_event_blocks(n // 3 or 1)
+    n_ev = len(blocks) // 2
+
+    t_before = _timeit(build_events_reference, blocks)
+    t_after = _timeit(lambda b: parse_log.events_model_to_frame(parse_log.build_events(b, raw_events=False)), blocks)
+    _report("events_join", n_ev, "evts", t_before, t_after)
+
+    del blocks
+    for raw in (True, False):
+        tracemalloc.start()
+        model = parse_log.build_events(iter_event_blocks(n // 3 or 1), raw_events=raw)
+        kept = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del model
+        print("%-28s raw_events=%-5s retido: %7.1f MB" % ("events_join", raw, kept / 1e6))
+
+
+def bench_time(n=1000000):
+    """
+    parse_rt130_time sem cache (referência) vs memoizado (LRU) vs
+    rt130_times_to_datetime64 (coluna inteira de uma vez).
+    """
+    strs = make_time_strings(n)
+    uncached = parse_log.parse_rt130_time.__wrapped__
+
+    def run(parse):
+        for s in strs:
+            parse(s)
+
+    parse_log.parse_rt130_time.cache_clear()
+    t_before = _timeit(run, uncached)
+    t_after = _timeit(run, parse_log.parse_rt130_time)
+    _report("rt130_time (lru)", n, "strs", t_before, t_after)
+    t_after = _timeit(parse_log.rt130_times_to_datetime64, strs)
+    _report("rt130_time (vetorizado)", n, "strs", t_before, t_after)
+
+
+BENCHMARKS = {
+    "soh": bench_soh_classifier,
+    "clock": bench_external_clock,
+    "events": bench_events,
+    "time": bench_time,
+}
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Micro-benchmarks do parse_log (corpus sintético).")
+    ap.add_argument("which", nargs="*", default=sorted(BENCHMARKS), help="Benchmarks: %s" % ", ".join(sorted(BENCHMARKS)))
+    ap.add_argument("-n", type=int, default=None, help="Tamanho do corpus (default de cada benchmark)")
+    args = ap.parse_args()
+
+    for name in args.which:
+        fn = BENCHMARKS[name]
+        if args.n:
+            fn(args.n)
+        else:
+            fn()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
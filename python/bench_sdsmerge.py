@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+###
+#
+# Benchmarks for sdsmerge.py on synthetic SDS data
+#
+# check: creates a full day of 100 Hz three component data (STEIM2)
+#        in a temporary source SDS and half a day of the same channels
+#        in a temporary destination SDS, then times the check + merge
+#        of each source file and counts the bytes read from the source
+#        files (every open() done by sdsmerge is wrapped).
+#
+# merge: sample level merge of a pathological day, thousands of
+#        shuffled fragments, duplicated fragments and a sampling rate
+#        change (RT130 reconfiguration) half way, with merge_traces
+#        against the old cansimplemerge / multimerge path.
+#
+# Usage:
+#   python bench_sdsmerge.py [-b check,merge] [-r reclen] [-s sps] [-f fragments] [-n repeat]
+#
+#######
+
+import sys
+import time
+import __builtin__
+import shutil
+import tempfile
+from os import path, makedirs
+from optparse import OptionParser
+
+import numpy as np
+from obspy.core import Trace, Stream, UTCDateTime
+
+import sdsmerge
+
+NET, STA, LOC = "BL", "BENCH", ""
+CHANNELS = [ "HHZ", "HHN", "HHE" ]
+YEAR, JDAY = 2020, 100
+
+def setup_logs():
+    logger = sdsmerge.Logs(sdsmerge.Logs.ERROR, sys.stderr)
+    sdsmerge.logger     = logger
+    sdsmerge.logerror   = logger.error
+    sdsmerge.logwarning = logger.warn
+    sdsmerge.loginfo    = logger.info
+    sdsmerge.logdebug   = logger.debug
+
+def sds_file(folder, cha):
+    name = "%s.%s.%s.%s.D.%04d.%03d" % (NET, STA, LOC, cha, YEAR, JDAY)
+    return path.join(folder, str(YEAR), NET, STA, "%s.D" % cha, name)
+
+def write_day(folder, cha, sps, start, end, reclen, seed):
+
+    # Random walk samples between start/end seconds of the day
+    #
+    rnd = np.random.RandomState(seed)
+    npts = int((end - start) * sps)
+    data = np.cumsum(rnd.randint(-50, 51, npts)).astype(np.int32)
+
+    tr = Trace(data)
+    tr.stats.network = NET
+    tr.stats.station = STA
+    tr.stats.location = LOC
+    tr.stats.channel = cha
+    tr.stats.sampling_rate = sps
+    tr.stats.starttime = UTCDateTime(year = YEAR, julday = JDAY) + start
+
+    filename = sds_file(folder, cha)
+    if not path.isdir(path.dirname(filename)): makedirs(path.dirname(filename))
+    Stream([tr]).write(filename, "MSEED", encoding = "STEIM2", reclen = reclen)
+    return filename
+
+def timeit(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.time()
+        fn()
+        dt = time.time() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+class CountingFile(object):
+
+    # File object counting the bytes read into counter[0]
+    #
+    def __init__(self, fd, counter):
+        self._fd = fd
+        self._counter = counter
+
+    def read(self, *args):
+        data = self._fd.read(*args)
+        self._counter[0] += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._fd, name)
+
+def source_bytes_read(folder, fn):
+
+    # Run fn and return the bytes read from the files under folder by
+    # sdsmerge (its module level open() is replaced while fn runs)
+    #
+    counter = [ 0 ]
+    folder = path.abspath(folder) + "/"
+    def counting_open(name, *args, **kwargs):
+        fd = __builtin__.open(name, *args, **kwargs)
+        if path.abspath(name).startswith(folder):
+            return CountingFile(fd, counter)
+        return fd
+
+    sdsmerge.open = counting_open
+    try:
+        fn()
+    finally:
+        del sdsmerge.open
+    return counter[0]
+
+def cansimplemerge(stream):
+    sps = None
+    for t in stream:
+        if sps is None:
+            sps = t.stats.sampling_rate
+        if t.stats.sampling_rate != sps:
+            return False
+    return True
+
+def multimerge(st):
+    #
+    # Split streams by sps ! (sdsmerge before merge_traces)
+    #
+    streams = { }
+    while st:
+        trone = st.pop()
+        sps = trone.stats.sampling_rate
+        try:
+            ts = streams[sps]
+        except KeyError:
+            ts = Stream()
+            streams[sps] = ts
+        ts.append(trone)
+
+    merged = Stream()
+    for t in streams.keys():
+        streams[t].merge(method=-1, misalignment_threshold = 0.25)
+        merged += streams[t]
+        del streams[t]
+
+    return merged
+
+def old_merge(st):
+    if cansimplemerge(st):
+        st.merge(method=-1)
+    else:
+        st = multimerge(st)
+    st.sort(['starttime'])
+    return st
+
+def new_merge(st):
+    st = sdsmerge.merge_traces(st)
+    st.sort(['starttime'])
+    return st
+
+def fragmented_day(sps, nfragments, seed):
+
+    # One channel day cut in nfragments pieces, the second half
+    # resampled at sps / 2, 5% of the pieces duplicated, all shuffled
+    #
+    rnd = np.random.RandomState(seed)
+    t0 = UTCDateTime(year = YEAR, julday = JDAY)
+    traces = [ ]
+    half = nfragments // 2
+    for (rate, start, n) in ((sps, 0, half), (sps / 2.0, 43200, nfragments - half)):
+        npts = int(43200 * rate)
+        data = np.cumsum(rnd.randint(-50, 51, npts)).astype(np.int32)
+        cuts = np.linspace(0, npts, n + 1).astype(int)
+        for (i, j) in zip(cuts[:-1], cuts[1:]):
+            tr = Trace(data[i:j].copy())
+            tr.stats.network = NET
+            tr.stats.station = STA
+            tr.stats.location = LOC
+            tr.stats.channel = CHANNELS[0]
+            tr.stats.sampling_rate = rate
+            tr.stats.starttime = t0 + start + i / rate
+            traces.append(tr)
+
+    for k in rnd.choice(len(traces), len(traces) // 20, replace = False):
+        traces.append(traces[k].copy())
+
+    rnd.shuffle(traces)
+    return Stream(traces)
+
+def bench_merge_engine(sps, nfragments, repeat):
+    st = fragmented_day(sps, nfragments, 0)
+
+    a = old_merge(st.copy())
+    b = new_merge(st.copy())
+    same = len(a) == len(b) and all([ x.stats.starttime == y.stats.starttime and np.array_equal(x.data, y.data) for (x, y) in zip(a, b) ])
+
+    t_before = timeit(lambda: old_merge(st.copy()), repeat)
+    t_after = timeit(lambda: new_merge(st.copy()), repeat)
+
+    print "merge  %d fragments (%d traces with duplicates), %d Hz -> %d Hz" % (nfragments, len(st), sps, sps / 2)
+    print "  before: %7.2fs  traces out: %d" % (t_before, len(a))
+    print "  after : %7.2fs  traces out: %d  (x%.2f) same output: %s" % (t_after, len(b), t_before / t_after, same)
+
+def bench_check_merge(tmp, sps, reclen, repeat):
+
+    # Source: full day, destination: first half of the day
+    #
+    source = path.join(tmp, "source")
+    destination = path.join(tmp, "destination")
+    files = [ ]
+    for (i, cha) in enumerate(CHANNELS):
+        files.append(write_day(source, cha, sps, 0, 86400, reclen, i))
+        write_day(destination, cha, sps, 0, 43200, reclen, i)
+
+    nbytes = sum([ path.getsize(f) for f in files ])
+
+    def before():
+        # check_file and execute_merge each read the source file
+        #
+        for current in files:
+            status = sdsmerge.check_file(source, current)
+            sdsmerge.execute_merge(current, destination, sdsmerge.Mode.ARCHIVE, False, False, status == sdsmerge.CheckStatus.FORCESORT, True)
+
+    def after():
+        # One read: check fills the SourceFile, merge reuses it
+        #
+        for current in files:
+            src = sdsmerge.SourceFile(current)
+            status = sdsmerge.check_file(source, current, src)
+            sdsmerge.execute_merge(current, destination, sdsmerge.Mode.ARCHIVE, False, False, status == sdsmerge.CheckStatus.FORCESORT, True, src)
+
+    t_before = timeit(before, repeat)
+    t_after = timeit(after, repeat)
+    read_before = source_bytes_read(source, before)
+    read_after = source_bytes_read(source, after)
+
+    print "check+merge  %d x %d Hz day, %.1f MB source (reclen %d)" % (len(files), sps, nbytes / 1e6, reclen)
+    print "  before: %7.2fs  source bytes read: %7.1f MB" % (t_before, read_before / 1e6)
+    print "  after : %7.2fs  source bytes read: %7.1f MB  (x%.2f)" % (t_after, read_after / 1e6, t_before / t_after)
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-b", "--bench", type="string", dest="bench", help="Benchmarks to run (check,merge)", default="check,merge")
+    parser.add_option("-r", "--reclen", type="int", dest="reclen", help="miniSEED record length", default=512)
+    parser.add_option("-s", "--sps", type="float", dest="sps", help="Sampling rate (Hz)", default=100.0)
+    parser.add_option("-f", "--fragments", type="int", dest="fragments", help="Number of fragments for the merge benchmark", default=5000)
+    parser.add_option("-n", "--repeat", type="int", dest="repeat", help="Repetitions (best time is reported)", default=3)
+    (options, args) = parser.parse_args()
+
+    setup_logs()
+    benches = options.bench.split(",")
+
+    if "check" in benches:
+        tmp = tempfile.mkdtemp(prefix = "bench_sdsmerge_")
+        try:
+            bench_check_merge(tmp, options.sps, options.reclen, options.repeat)
+        finally:
+            shutil.rmtree(tmp)
+
+    if "merge" in benches:
+        bench_merge_engine(options.sps, options.fragments, options.repeat)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+###
+#
+# Record sequence validation shared by sdsmerge.py and sdsClone.py
+#
+# The record headers of a day file (codes, start/end time, number of
+# samples and sampling rate) are decoded once into a NumPy array by
+# msheader.py, the checks (codes, day fit and order/overlap) are then
+# computed with array operations instead of record by record.
+#
+# Times are kept as integer microseconds since 1970-01-01.
+#
+#######
+
+import datetime
+import numpy as np
+
+from msheader import RECORD
+
+# Sequence classes, on comments P = Previous C = Current
+#
+INORDER       = 0
+BACK_WHOLE    = 1   # [C--C P--P]
+BACK_PARTIAL  = 2   # [C-P-C-P]
+BACK_TOTAL    = 3   # [C-P--P-C]
+INSIDE        = 4   # [P-C--C-P]
+OVERLAP_END   = 5   # [P-C-P-C]
+
+SEQUENCE_MESSAGES = {
+    BACK_WHOLE:   "goes back (whole record) [C--C P--P]",
+    BACK_PARTIAL: "goes back (partial overlap start) [C-P-C-P]",
+    BACK_TOTAL:   "goes back (total overlap) [C-P--P-C]",
+    INSIDE:       "goes back (complete inside) [P-C--C-P]",
+    OVERLAP_END:  "goes back (partial overlap end) [P-C-P-C]",
+}
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+def microseconds(t):
+    # datetime -> integer microseconds since epoch
+    #
+    return (((t.toordinal() - _EPOCH_ORDINAL) * 86400 + t.hour * 3600 + t.minute * 60 + t.second) * 1000000 + t.microsecond)
+
+def code_mismatch(hdr, net, sta, loc, cha):
+
+    # Per code, records whose header does not match the file name
+    # (a code longer than the SEED field never matches)
+    #
+    mismatch = { }
+    for (name, value) in (("net", net), ("sta", sta), ("loc", loc), ("cha", cha)):
+        if len(value) > RECORD[name].itemsize:
+            mismatch[name] = np.ones(len(hdr), dtype = bool)
+        else:
+            mismatch[name] = hdr[name] != np.array(value, dtype = RECORD[name])
+    return mismatch
+
+def outside_day(hdr, start, end, inclusive = False):
+
+    # Records starting outside [start, end) (or [start, end] when
+    # inclusive). start/end are datetime objects.
+    #
+    start = microseconds(start)
+    end = microseconds(end)
+    if inclusive:
+        return (hdr["begin"] < start) | (hdr["begin"] > end)
+    return (hdr["begin"] < start) | (hdr["begin"] >= end)
+
+def tolerance(hdr, fraction):
+
+    # Time tolerance of each record: sample interval / fraction (us)
+    #
+    fsamp = hdr["fsamp"]
+    tol = np.zeros(len(hdr))
+    valid = fsamp > 0
+    tol[valid] = 1e6 / fsamp[valid] / fraction
+    return tol
+
+def sequence(hdr, fraction):
+
+    # Class of each record relative to the previous one (the first
+    # record is always INORDER). The current record start/end are
+    # shifted by its tolerance (1 / fsamp / fraction).
+    #
+    classes = np.zeros(len(hdr), dtype = np.int8)
+    if len(hdr) < 2:
+        return classes
+
+    tol = tolerance(hdr, fraction)[1:]
+    b = hdr["begin"][1:] + tol
+    e = hdr["end"][1:] + tol
+    pb = hdr["begin"][:-1]
+    pe = hdr["end"][:-1]
+
+    back = b < pb
+    over = ~back & (b < pe)
+
+    c = classes[1:]
+    c[back] = BACK_TOTAL
+    c[back & (e < pe)] = BACK_PARTIAL
+    c[back & (e < pb)] = BACK_WHOLE
+    c[over] = OVERLAP_END
+    c[over & (e < pe)] = INSIDE
+    return classes
+
+def first(mask):
+
+    # Index of the first True, or None
+    #
+    idx = np.flatnonzero(mask)
+    return int(idx[0]) if len(idx) else None
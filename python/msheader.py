@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+###
+#
+# Memory mapped miniSEED header reader shared by sdsClone.py,
+# sdsmerge.py, mssort.py and msindex.py
+#
+# Only the fixed section of data header and the blockette 1000 / 1001
+# fields are decoded, with NumPy, over the mapped file (or the bytes
+# already in memory): the data payloads are never copied nor
+# decompressed. Fixed length files (the usual case) are read as one
+# strided view over the buffer, without any copy, other files are
+# walked record by record and only their headers are gathered.
+#
+# The result is a record header array (RECORD), times are kept as
+# integer microseconds since 1970-01-01, as in mscheck.py.
+#
+# Depends on: numpy (in the interpreter running the calling script)
+#
+#######
+
+import os
+import mmap
+import struct
+import datetime
+from contextlib import contextmanager
+
+import numpy as np
+
+# Fixed section of data header (48 bytes), blockette 1000 (8 bytes)
+# and blockette 1001 (8 bytes) when they follow the fixed header
+#
+def _header_dtype(order):
+    return np.dtype([ ("seq", "S6"), ("quality", "S1"), ("reserved", "S1"),
+                      ("sta", "S5"), ("loc", "S2"), ("cha", "S3"), ("net", "S2"),
+                      ("year", order + "u2"), ("jday", order + "u2"), ("hour", "u1"), ("minute", "u1"),
+                      ("second", "u1"), ("unused", "u1"), ("fract", order + "u2"),
+                      ("nsamp", order + "u2"), ("factor", order + "i2"), ("multiplier", order + "i2"),
+                      ("activity", "u1"), ("io", "u1"), ("dataquality", "u1"), ("nblockettes", "u1"),
+                      ("correction", order + "i4"), ("dataoffset", order + "u2"), ("blockoffset", order + "u2"),
+                      ("b1000type", order + "u2"), ("b1000next", order + "u2"),
+                      ("encoding", "u1"), ("wordorder", "u1"), ("reclen", "u1"), ("b1000reserved", "u1"),
+                      ("b1001type", order + "u2"), ("b1001next", order + "u2"),
+                      ("timingquality", "u1"), ("usec", "i1"), ("b1001reserved", "u1"), ("frames", "u1") ])
+
+HEADER_BE = _header_dtype(">")
+HEADER_LE = _header_dtype("<")
+HEADER_SIZE = HEADER_BE.itemsize   # 64
+
+RECORD = np.dtype([ ("net", "S2"), ("sta", "S5"), ("loc", "S2"), ("cha", "S3"),
+                    ("begin", "i8"), ("end", "i8"), ("nsamp", "i4"), ("fsamp", "f8"),
+                    ("offset", "i8"), ("length", "i8") ])
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+class HeaderError(Exception):
+    pass
+
+def _byteorder(buf):
+    # Header byte order, from a plausible year on the first record
+    #
+    (year,) = struct.unpack(">H", buf[20:22])
+    if 1900 <= year <= 2100:
+        return HEADER_BE
+    return HEADER_LE
+
+def _blockettes(buf, offset, order):
+    # (record length, microseconds) from blockettes 1000 / 1001,
+    # walking the blockette chain of the record at offset
+    #
+    fmt = ">" if order is HEADER_BE else "<"
+    reclen = None
+    usec = 0
+    (nxt,) = struct.unpack(fmt + "H", buf[offset + 46:offset + 48])
+    while nxt:
+        (btype, following) = struct.unpack(fmt + "HH", buf[offset + nxt:offset + nxt + 4])
+        if btype == 1000:
+            reclen = 1 << ord(buf[offset + nxt + 6:offset + nxt + 7])
+        elif btype == 1001:
+            (usec,) = struct.unpack("b", buf[offset + nxt + 5:offset + nxt + 6])
+        if following <= nxt: break
+        nxt = following
+    if reclen is None:
+        raise HeaderError("record at %d has no blockette 1000" % offset)
+    return (reclen, usec)
+
+def sample_rate(hdr):
+    factor = hdr["factor"].astype(np.float64)
+    multiplier = hdr["multiplier"].astype(np.float64)
+    rate = np.zeros(len(hdr))
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        rate = np.where((factor > 0) & (multiplier > 0), factor * multiplier, rate)
+        rate = np.where((factor > 0) & (multiplier < 0), -factor / multiplier, rate)
+        rate = np.where((factor < 0) & (multiplier > 0), -multiplier / factor, rate)
+        rate = np.where((factor < 0) & (multiplier < 0), 1.0 / (factor * multiplier), rate)
+    return rate
+
+def start_times(hdr, usec = 0):
+    # Record start times, integer microseconds since epoch (the time
+    # correction is added when not applied yet, usec are the blockette
+    # 1001 microseconds)
+    #
+    days = (hdr["year"].astype(np.int64) - 1970).astype("datetime64[Y]").astype("datetime64[D]").astype(np.int64) + hdr["jday"] - 1
+    (hour, minute, second, fract) = [ hdr[f].astype(np.int64) for f in ("hour", "minute", "second", "fract") ]
+    us = (days * 86400 + hour * 3600 + minute * 60 + second) * 1000000 + fract * 100 + usec
+    pending = (hdr["activity"] & 0x02) == 0
+    return us + np.where(pending, hdr["correction"].astype(np.int64) * 100, 0)
+
+def end_times(hdr, begin, rate = None):
+    # Record end times, the time just after the last sample
+    #
+    if rate is None: rate = sample_rate(hdr)
+    span = np.zeros(len(hdr), dtype = np.int64)
+    valid = rate > 0
+    span[valid] = np.round(hdr["nsamp"][valid] / rate[valid] * 1e6).astype(np.int64)
+    return begin + span
+
+def datetimes(us):
+    # Integer microseconds since epoch -> list of datetime
+    #
+    return [ _EPOCH + datetime.timedelta(microseconds = u) for u in us.tolist() ]
+
+class Headers(object):
+    '''
+    Record headers of a miniSEED buffer (a map of the file or its bytes
+    in memory): offsets, lengths, the raw header array (a view over the
+    buffer when the records have a fixed length) and the blockette 1001
+    microseconds of each record.
+    '''
+    def __init__(self, buf, size = None):
+        self.buf = buf
+        self.size = len(buf) if size is None else size
+        self.order = HEADER_BE
+        self.offsets = np.zeros(0, dtype = np.int64)
+        self.lengths = np.zeros(0, dtype = np.int64)
+        self.usec = np.zeros(0, dtype = np.int64)
+        self.raw = np.zeros(0, dtype = self.order)
+
+        if self.size == 0:
+            return
+        if self.size < HEADER_SIZE:
+            raise HeaderError("truncated record (%d bytes)" % self.size)
+
+        self.order = _byteorder(buf)
+        if not self._fixed():
+            self._walk()
+
+    def _fixed(self):
+        # Fixed length records: one strided view, nothing is copied
+        #
+        (reclen, _) = _blockettes(self.buf, 0, self.order)
+        if reclen < HEADER_SIZE or self.size % reclen:
+            return False
+
+        n = self.size // reclen
+        raw = np.ndarray(shape = (n,), dtype = self.order, buffer = self.buf, offset = 0, strides = (reclen,))
+        if not np.all((raw["b1000type"] == 1000) & (raw["blockoffset"] == 48) & (raw["reclen"] == raw["reclen"][0])):
+            return False
+
+        self.raw = raw
+        self.offsets = np.arange(0, self.size, reclen, dtype = np.int64)
+        self.lengths = np.empty(n, dtype = np.int64)
+        self.lengths.fill(reclen)
+
+        # Blockette 1001 right after blockette 1000 is read from the
+        # view, any other chain is walked
+        #
+        b1001 = (raw["b1000next"] == 56) & (raw["b1001type"] == 1001)
+        self.usec = np.where(b1001, raw["usec"], 0).astype(np.int64)
+        for i in np.flatnonzero((raw["b1000next"] != 0) & ~(b1001 & (raw["b1001next"] == 0))):
+            (_, self.usec[i]) = _blockettes(self.buf, self.offsets[i], self.order)
+        return True
+
+    def _walk(self):
+        # Variable length records: walk the file, gather the headers
+        #
+        offsets = [ ]
+        lengths = [ ]
+        usec = [ ]
+        offset = 0
+        while offset < self.size:
+            if offset + HEADER_SIZE > self.size:
+                raise HeaderError("truncated record at %d" % offset)
+            (reclen, us) = _blockettes(self.buf, offset, self.order)
+            if reclen < HEADER_SIZE:
+                raise HeaderError("record at %d has an invalid length (%d)" % (offset, reclen))
+            if offset + reclen > self.size:
+                raise HeaderError("truncated record at %d (%d of %d bytes)" % (offset, self.size - offset, reclen))
+            offsets.append(offset)
+            lengths.append(reclen)
+            usec.append(us)
+            offset += reclen
+
+        self.offsets = np.array(offsets, dtype = np.int64)
+        self.lengths = np.array(lengths, dtype = np.int64)
+        self.usec = np.array(usec, dtype = np.int64)
+        raw = np.frombuffer(self.buf, dtype = np.uint8, count = self.size)
+        self.raw = raw[self.offsets[:, None] + np.arange(HEADER_SIZE)].copy().view(self.order)[:, 0]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def records(self):
+        '''
+        Record header array (RECORD) of the buffer, codes stripped
+        '''
+        hdr = self.raw
+        rec = np.zeros(len(hdr), dtype = RECORD)
+        for code in ("net", "sta", "loc", "cha"):
+            rec[code] = np.char.strip(hdr[code])
+        rate = sample_rate(hdr)
+        rec["begin"] = start_times(hdr, self.usec)
+        rec["end"] = end_times(hdr, rec["begin"], rate)
+        rec["nsamp"] = hdr["nsamp"]
+        rec["fsamp"] = rate
+        rec["offset"] = self.offsets
+        rec["length"] = self.lengths
+        return rec
+
+    def release(self):
+        # Drop the views over the buffer (before closing a map)
+        #
+        self.raw = None
+        self.buf = None
+
+@contextmanager
+def mapped(filename):
+    '''
+    Headers of a memory mapped file, the map is closed on exit
+    '''
+    size = os.path.getsize(filename)
+    if size == 0:
+        yield Headers(b"")
+        return
+
+    fd = open(filename, "rb")
+    try:
+        buf = mmap.mmap(fd.fileno(), 0, access = mmap.ACCESS_READ)
+        headers = None
+        try:
+            headers = Headers(buf, size)
+            yield headers
+        finally:
+            if headers is not None: headers.release()
+            del headers
+            try:
+                buf.close()
+            except BufferError:
+                # A view still referenced by an exception being raised,
+                # the map is closed once it is released
+                pass
+    finally:
+        fd.close()
+
+def read(filename):
+    '''
+    Record header array of a file
+    '''
+    with mapped(filename) as headers:
+        return headers.records()
+
+def scan(data):
+    '''
+    Record header array of the bytes of a file already in memory
+    '''
+    return Headers(data).records()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+###
+#
+# SDS file indexer for index.sh, replacing the per file call to
+#   msi -tf 2 -T <file>
+#
+# Files are read with msheader.py (memory mapped, headers only) in a
+# single process for a whole list of files. Contiguous records of the
+# same stream and sampling rate are joined into traces, as msi does
+# (time tolerance of half a sample), and each trace is written as one
+# line ready for mysqlimport:
+#
+#   filename <tab> mtime <tab> NET.STA.LOC.CHA <tab> start <tab> end <tab> sps
+#
+# start / end are epoch seconds of the first / last sample.
+#
+# Usage:
+#   python msindex.py [-s SDS] [-p] [SDS file names]
+#
+# File names are the SDS basenames (NET.STA.LOC.CHA.D.YEAR.JDAY), read
+# from the standard input when not given.
+#
+# Runs on Python 2 and 3, needs NumPy and msheader.py installed in the
+# same folder.
+#
+#######
+
+from __future__ import print_function
+
+import os
+import sys
+from optparse import OptionParser
+
+import numpy as np
+
+import msheader
+
+def sds_path(sds, basename):
+    (net, sta, loc, cha, stream, year, jday) = basename.split(".")
+    return os.path.join(sds, "%04d" % int(year), net, sta, "%s.%s" % (cha, stream), basename)
+
+def traces(rec):
+
+    # Join the records (msheader.RECORD) into traces. Returns a list of
+    # (codes, start, end, fsamp), start / end in microseconds of the
+    # first / last sample, sorted by codes and start.
+    #
+    if len(rec) == 0:
+        return [ ]
+
+    codes = np.char.add(np.char.add(np.char.add(rec["net"], b"."), np.char.add(rec["sta"], b".")),
+                        np.char.add(np.char.add(rec["loc"], b"."), rec["cha"]))
+    (_, codeid) = np.unique(codes, return_inverse = True)
+    order = np.lexsort((rec["begin"], rec["fsamp"], codeid))
+    (codes, codeid, rec) = (codes[order], codeid[order], rec[order])
+
+    fsamp = rec["fsamp"]
+    valid = fsamp > 0
+    period = np.zeros(len(rec))
+    period[valid] = 1e6 / fsamp[valid]
+
+    # A new trace starts on a new stream, a sampling rate change or a
+    # gap / overlap above half a sample
+    #
+    new = np.ones(len(rec), dtype = bool)
+    new[1:] = ((codeid[1:] != codeid[:-1]) |
+               (np.abs(1.0 - fsamp[1:] / np.where(valid[:-1], fsamp[:-1], 1.0)) > 0.0001) |
+               (np.abs(rec["begin"][1:] - rec["end"][:-1]) > period[1:] / 2.0) |
+               ~valid[1:])
+    first = np.flatnonzero(new)
+    last = np.append(first[1:], len(rec)) - 1
+
+    result = [ ]
+    for (i, j) in zip(first, last):
+        end = rec["end"][j] - period[j] if valid[j] else rec["begin"][j]
+        result.append((codes[i].decode("ascii"), rec["begin"][i], max(end, rec["begin"][i]), fsamp[i]))
+    result.sort(key = lambda t: (t[0], t[1]))
+    return result
+
+def index(filename, basename, out):
+    mtime = int(os.path.getmtime(filename))
+    for (codes, start, end, fsamp) in traces(msheader.read(filename)):
+        print("%s\t%d\t%s\t%f\t%f\t%f" % (basename, mtime, codes, start / 1e6, end / 1e6, fsamp), file=out)
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options] [SDS file names]")
+    parser.add_option("-s", "--sds", type="string", dest="sds", help="Base SDS folder", default="/SDS/")
+    parser.add_option("-p", "--progress", action="store_true", dest="progress", help="Report each file on the standard error", default=False)
+    (options, args) = parser.parse_args()
+
+    names = args if args else [ line.strip() for line in sys.stdin if line.strip() ]
+
+    errors = 0
+    for (i, basename) in enumerate(names):
+        if options.progress:
+            print("  [%05d/%05d] %-28s" % (i + 1, len(names), basename), file=sys.stderr)
+
+        try:
+            filename = sds_path(options.sds, basename)
+        except ValueError:
+            print("%s is not a SDS file name." % basename, file=sys.stderr)
+            errors += 1
+            continue
+
+        if not os.path.isfile(filename):
+            print("cannot be found in folder %s." % filename, file=sys.stderr)
+            errors += 1
+            continue
+
+        try:
+            index(filename, basename, sys.stdout)
+        except Exception as e:
+            print("%s: %s" % (filename, e), file=sys.stderr)
+            errors += 1
+
+    sys.exit(1 if errors else 0)
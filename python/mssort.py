@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+###
+#
+# In place miniSEED record sorter, replacing the calls to
+#   dataselect -Pr -rep -mod -nb <file>
+# in sdsClone.py and R2M.py
+#
+# The file is memory mapped and only the fixed headers (and the
+# blockettes 1000 / 1001) are decoded, with msheader.py, into a record
+# index. Records are sorted by (codes, start time, end time) and exact
+# duplicates (same times and same bytes after the sequence number and
+# quality flag) are pruned. The file is rewritten, through a temporary
+# file renamed over it (with the mode, owner and group of the original),
+# only when the order changed or duplicates were found: a file already
+# in order costs just the header scan.
+#
+# Usage:
+#   python mssort.py [-j jobs] [-n] <files or folders>
+#
+# Depends on: numpy, msheader.py (installed in the same folder)
+#
+#######
+
+import os
+import sys
+import stat
+from optparse import OptionParser
+import multiprocessing
+
+import numpy as np
+
+import msheader
+
+def sort_file(filename, dryrun = False):
+
+    # Sort / deduplicate one file in place. Returns (records, pruned,
+    # rewritten)
+    #
+    size = os.path.getsize(filename)
+    if size < msheader.HEADER_SIZE:
+        return (0, 0, False)
+
+    with msheader.mapped(filename) as headers:
+        buf = headers.buf
+        (offsets, lengths) = (headers.offsets, headers.lengths)
+        rec = headers.records()
+
+        (begin, end) = (rec["begin"], rec["end"])
+        codes = np.char.add(np.char.add(rec["net"], rec["sta"]), np.char.add(rec["loc"], rec["cha"]))
+        (_, codeid) = np.unique(codes, return_inverse = True)
+
+        index = np.lexsort((end, begin, codeid))
+
+        # Exact duplicates are in the same run of records with equal
+        # (codes, begin, end) once sorted, not always next to each other
+        # (A, B, A): each record is compared with all the others of its run
+        #
+        new = np.ones(len(index), dtype = bool)
+        new[1:] = ((codeid[index][1:] != codeid[index][:-1]) |
+                   (begin[index][1:] != begin[index][:-1]) |
+                   (end[index][1:] != end[index][:-1]))
+        first = np.flatnonzero(new)
+        last = np.append(first[1:], len(index))
+        keep = np.ones(len(index), dtype = bool)
+        for k in np.flatnonzero(last - first > 1):
+            seen = set()
+            for i in range(first[k], last[k]):
+                j = index[i]
+                content = buf[offsets[j] + 8:offsets[j] + lengths[j]]
+                if content in seen:
+                    keep[i] = False
+                else:
+                    seen.add(content)
+
+        index = index[keep]
+        pruned = len(keep) - len(index)
+
+        if pruned == 0 and np.all(index == np.arange(len(index))):
+            return (len(offsets), 0, False)
+
+        if not dryrun:
+            tmpname = os.path.join(os.path.dirname(filename), ".%s.%d.tmp" % (os.path.basename(filename), os.getpid()))
+            out = open(tmpname, "wb")
+            try:
+                for i in index:
+                    out.write(buf[offsets[i]:offsets[i] + lengths[i]])
+                out.flush()
+                os.fsync(out.fileno())
+                out.close()
+
+                # Keep the mode, owner and group of the original file
+                # (shared /SDS trees), the owner only when allowed
+                #
+                st = os.stat(filename)
+                os.chmod(tmpname, stat.S_IMODE(st.st_mode))
+                try:
+                    os.chown(tmpname, st.st_uid, st.st_gid)
+                except OSError:
+                    try:
+                        os.chown(tmpname, -1, st.st_gid)
+                    except OSError:
+                        pass
+                os.rename(tmpname, filename)
+            except:
+                out.close()
+                if os.path.isfile(tmpname): os.remove(tmpname)
+                raise
+
+        return (len(offsets), pruned, True)
+
+def _sort_one(args):
+    (filename, dryrun) = args
+    try:
+        return (filename, sort_file(filename, dryrun), None)
+    except Exception as e:
+        return (filename, None, str(e))
+
+def iter_files(items):
+    for item in items:
+        if os.path.isdir(item):
+            for (root, dirs, files) in os.walk(item):
+                dirs.sort()
+                for f in sorted(files):
+                    if not f.startswith("."):
+                        yield os.path.join(root, f)
+        else:
+            yield item
+
+def sort_files(files, jobs = 1, dryrun = False):
+
+    # Sort many files on a pool of jobs processes. Yields (filename,
+    # (records, pruned, rewritten), error) in the order of files.
+    #
+    tasks = ((f, dryrun) for f in files)
+    if jobs <= 1:
+        for task in tasks:
+            yield _sort_one(task)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap(_sort_one, tasks, 8):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options] <files or folders>")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", help="Number of parallel processes", default=1)
+    parser.add_option("-n", "--dry-run", action="store_true", dest="dryrun", help="Only report the files that would be rewritten", default=False)
+    parser.add_option("-v", "--verbose", action="store_true", dest="verbose", help="Report every file", default=False)
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error("No files given")
+
+    counts = { "files": 0, "rewritten": 0, "pruned": 0, "errors": 0 }
+    for (filename, result, error) in sort_files(iter_files(args), options.jobs, options.dryrun):
+        counts["files"] += 1
+        if error is not None:
+            counts["errors"] += 1
+            print >>sys.stderr, "%s: %s" % (filename, error)
+            continue
+        (records, pruned, rewritten) = result
+        counts["pruned"] += pruned
+        if rewritten: counts["rewritten"] += 1
+        if rewritten or options.verbose:
+            print "%s: %d records, %d duplicates pruned%s" % (filename, records, pruned, ", sorted" if rewritten else "")
+
+    print "Files: %(files)d Rewritten: %(rewritten)d Duplicates: %(pruned)d Errors: %(errors)d" % counts
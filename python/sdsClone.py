@@ -1,11 +1,24 @@
 #!/home/suporte/seiscomp/bin/seiscomp-python
 #
+# Depends on: numpy (for seiscomp-python), mscheck.py, msheader.py and
+#             mssort.py (installed in the same folder)
+#
 import os
-from seiscomp import mseedlite, logs
+from seiscomp import logs
 import sys
 import datetime
-import subprocess
+import time
 import re
+import multiprocessing
+import sqlite3
+import json
+import numpy as np
+from StringIO import StringIO
+from collections import OrderedDict
+
+import mscheck
+import msheader
+import mssort
 
 from optparse import OptionParser
 
@@ -23,8 +36,9 @@ class MSFile(object):
         self._verbose = verbose
         self._testboard = {}
         self._validSDSpath = True
+        self._failed = False
         ## Attach the log file
-        self._log = logfile if type(logfile) == file else sys.stderr
+        self._log = logfile if hasattr(logfile, "write") else sys.stderr
         ## Save the file path
         self.directory = directory
         self.filename = filename
@@ -50,67 +64,10 @@ class MSFile(object):
             ## Run the check sequence
             self.check()
         except Exception as e:
+            self._failed = True
             print >>self._log,"Error checking %s on %s" % (self.filename, self.directory)
             print >>self._log," %s" % str(e)
 
-    def _checkStartTime(self, rec):
-        if not self._validSDSpath: return False
-        if rec.begin_time >= self.s and rec.begin_time < self.e:
-            return
-        raise Exception(" checkStartTime:: Record start time does not fit day.")
-
-    def _checkCodes(self, record):
-        if not self._validSDSpath: return False
-        _raise = False
-        if record.net != self.net:
-            _raise = True
-        if record.sta != self.sta:
-            _raise = True
-        if record.loc != self.loc:
-            _raise = True
-        if record.cha != self.cha:
-            _raise = True
-        if _raise:
-            raise Exception(
-                " checkCodes:: (%s.%s.%s.%s does not match current file.)"
-                % (record.net, record.sta, record.loc, record.cha))
-
-    def _checkSequence(self, previousrecord, record):
-        _raise = False
-        _message = []
-
-        if not previousrecord:
-            return
-
-        _dt2 = datetime.timedelta(0, (1.0 / record.fsamp) / 2.0)
-
-        ##
-        # On comments P = Previous C = Current
-        ##
-        if ( record.begin_time + _dt2 ) < previousrecord.begin_time:
-            if ( record.end_time + _dt2 ) < previousrecord.begin_time:
-                _raise = True
-                #print record.begin_time, record.end_time, previousrecord.begin_time, previousrecord.end_time
-                _message.append("goes back (whole record) [C--C P--P]")
-            elif ( record.end_time + _dt2 ) < previousrecord.end_time:
-                _raise = True
-                _message.append( "goes back (partial overlap start) [C-P-C-P]")
-            else:
-                _raise = True
-                _message.append( "goes back (total overlap) [C-P--P-C]")
-        elif ( record.begin_time + _dt2 ) < previousrecord.end_time:
-            if ( record.end_time + _dt2 ) < previousrecord.end_time:
-                _raise = True
-                _message.append("goes back (complete inside) [P-C--C-P]")
-            else:
-                _raise = True
-                _message.append("goes back (partial overlap end) [P-C-P-C]")
-        else:
-            return 0
-
-        if _raise:
-            raise Exception(" checkSequence:: " + ",".join(_message))
-
     def _checkDuplicate(self, record, reclist):
         date = str(record.begin_time)
         if date in reclist:
@@ -130,65 +87,46 @@ class MSFile(object):
         raise Exception("Test %s is not available" % testName)
 
     def check(self):
-        infile = file(os.path.join(self.directory,self.filename))
-        records = mseedlite.Input(infile)
-        errors = []
-        previousrecord = None
-#         reclist = []
-        i = 0
+        ## Headers only, from a map of the file (msheader)
+        hdr = msheader.read(os.path.join(self.directory,self.filename))
 
         self._testboard['checkCodes'] = True
         self._testboard['checkSequence'] = True
         self._testboard['checkStartTime'] = True
         self._testboard['checkDuplicate'] = True
-        for record in records:
-            i += 1
-            ## Check Codes
-            try:
-                self._checkCodes(record)
-            except Exception as e:
-                self._testboard['checkCodes'] = False
-                if str(e) not in errors:
-                    if self._verbose:
-                        errors.append(str(i) + " " + str(e))
-                    else:
-                        errors.append(str(e))
-#             ## Check Duplicates
-#             try:
-#                 self._checkDuplicate(record, reclist)
-#             except Exception,e:
-#                 self._testboard['checkDuplicate'] = False
-#                 if str(e) not in errors:
-#                     if self._verbose:
-#                         errors.append(str(i) + " " + str(e))
-#                     else:
-#                         errors.append(str(e))
-            ## Check Sequence
-            try:
-                self._checkSequence(previousrecord, record)
-            except Exception,e:
-                self._testboard['checkSequence'] = False
-                if str(e) not in errors:
-                    if self._verbose:
-                        errors.append(str(i) + " " + str(e))
-                    else:
-                        errors.append(str(e))
-            ## Check Start time
-            try:
-                self._checkStartTime(record)
-            except Exception as e:
-                self._testboard['checkStartTime'] = False
-                if str(e) not in errors:
-                    if self._verbose:
-                        errors.append(str(i) + " " + str(e))
-                    else:
-                        errors.append(str(e))
 
-            ## Save current record on pipe
-            previousrecord = record
+        ## All records checked at once, only the failing ones are
+        ## visited to build the messages (in the same order as before)
+        codes = np.zeros(len(hdr), dtype = bool)
+        outside = np.zeros(len(hdr), dtype = bool)
+        if self._validSDSpath:
+            for mask in mscheck.code_mismatch(hdr, self.net, self.sta, self.loc, self.cha).values():
+                codes |= mask
+            outside = mscheck.outside_day(hdr, self.s, self.e)
+        sequence = mscheck.sequence(hdr, 2.0)
+
+        if codes.any(): self._testboard['checkCodes'] = False
+        if sequence.any(): self._testboard['checkSequence'] = False
+        if outside.any(): self._testboard['checkStartTime'] = False
 
-        # Close file
-        infile.close()
+        errors = []
+        for i in np.flatnonzero(codes | outside | (sequence != mscheck.INORDER)):
+            messages = []
+            if codes[i]:
+                record = hdr[i]
+                messages.append(" checkCodes:: (%s.%s.%s.%s does not match current file.)"
+                                % (record['net'], record['sta'], record['loc'], record['cha']))
+            if sequence[i]:
+                messages.append(" checkSequence:: " + mscheck.SEQUENCE_MESSAGES[sequence[i]])
+            if outside[i]:
+                messages.append(" checkStartTime:: Record start time does not fit day.")
+
+            for message in messages:
+                if message not in errors:
+                    if self._verbose:
+                        errors.append(str(i + 1) + " " + message)
+                    else:
+                        errors.append(message)
 
         # Present erros
         if len(errors):
@@ -196,11 +134,148 @@ class MSFile(object):
                 print >>self._log," %s" %line
         self._log.flush()
 
+class CheckCache(object):
+    '''
+    Persistent (SQLite) cache of the MSFile check results: testboard
+    and log lines, keyed by the file path and valid while its size,
+    mtime and inode do not change. Each process opens its own
+    connection, results are committed once per folder.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._db = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_db'] = None
+        return state
+
+    def db(self):
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.filename, timeout = 60)
+            self._pid = os.getpid()
+            self._db.execute("PRAGMA journal_mode=WAL")
+            with self._db:
+                self._db.execute("CREATE TABLE IF NOT EXISTS checks (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, inode INTEGER, verbose INTEGER, testboard TEXT, log TEXT)")
+        return self._db
+
+    def lookup(self, filename, verbose):
+        ## (testboard, log) of filename, or None if unknown or changed
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        row = self.db().execute("SELECT size, mtime, inode, verbose, testboard, log FROM checks WHERE path = ?", (os.path.abspath(filename),)).fetchone()
+        if row is None or tuple(row[:4]) != (st.st_size, st.st_mtime, st.st_ino, int(verbose)):
+            return None
+        return (json.loads(row[4]), row[5])
+
+    def store(self, filename, verbose, testboard, log):
+        ## A file removed since its check is just not cached
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return
+        self.db().execute("INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (os.path.abspath(filename), st.st_size, st.st_mtime, st.st_ino, int(verbose), json.dumps(testboard), log))
+
+    def commit(self):
+        if self._db is not None:
+            self._db.commit()
+
+class SDSCloner(object):
+    '''
+    Route the records of miniSEED files to the SDS day files of a
+    destination archive (by the record codes and start time, like
+    "cat file | scart archive"), appending in the order they are read.
+    Records are buffered per output file and written whole, the open
+    descriptors are kept in a LRU of at most maxopen files.
+    '''
+    def __init__(self, root, maxopen = 64, buffersize = 1 << 16):
+        self.root = root
+        self.maxopen = maxopen
+        self.buffersize = buffersize
+        self._open = OrderedDict() # filename -> [ fd, [ chunks ], size ]
+        self.files = 0
+        self.records = 0
+        self.bytes = 0
+
+    def _path(self, net, sta, loc, cha, year, jday):
+        return os.path.join(self.root, "%04d" % year, net, sta, "%s.D" % cha,
+                            "%s.%s.%s.%s.D.%04d.%03d" % (net, sta, loc, cha, year, jday))
+
+    def _flush(self, handle):
+        if handle[1]:
+            os.write(handle[0], "".join(handle[1]))
+            handle[1] = []
+            handle[2] = 0
+
+    def _handle(self, filename):
+        handle = self._open.pop(filename, None)
+        if handle is None:
+            if len(self._open) >= self.maxopen:
+                (_, old) = self._open.popitem(last = False)
+                self._flush(old)
+                os.close(old[0])
+
+            folder = os.path.dirname(filename)
+            if not os.path.isdir(folder):
+                try:
+                    os.makedirs(folder)
+                except OSError:
+                    if not os.path.isdir(folder): raise
+            handle = [ os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644), [], 0 ]
+
+        ## Most recently used at the end
+        self._open[filename] = handle
+        return handle
+
+    def add(self, infile):
+        ## Records are routed from their headers (msheader), the bytes are
+        ## sliced from the map of the file, nothing is decoded
+        with msheader.mapped(infile) as headers:
+            rec = headers.records()
+            days = (rec["begin"] // 86400000000).astype("datetime64[D]")
+            years = days.astype("datetime64[Y]")
+            jdays = (days - years.astype("datetime64[D]")).astype(np.int64) + 1
+            years = years.astype(np.int64) + 1970
+
+            buf = headers.buf
+            last = None
+            for (net, sta, loc, cha, year, jday, offset, length) in zip(rec["net"], rec["sta"], rec["loc"], rec["cha"],
+                                                                       years.tolist(), jdays.tolist(),
+                                                                       rec["offset"].tolist(), rec["length"].tolist()):
+                key = (net, sta, loc, cha, year, jday)
+                if key != last:
+                    filename = self._path(*key)
+                    last = key
+
+                handle = self._handle(filename)
+                handle[1].append(buf[offset:offset + length])
+                handle[2] += length
+                if handle[2] >= self.buffersize:
+                    self._flush(handle)
+
+                self.records += 1
+                self.bytes += length
+        self.files += 1
+
+    def close(self):
+        for handle in self._open.values():
+            self._flush(handle)
+            os.close(handle[0])
+        self._open.clear()
+
 class SDS (object):
 
     def __init__ (self, path = None, log = sys.stderr, y1 = 1980, y2 = 2500, patterns = None, verbose = False):
         self.path = path
         self._runScart = False
+        self._cache = None
+        self._nativeScart = True
+        self._cloner = None
+        self._clonestats = { 'files': 0, 'bytes': 0, 'seconds': 0.0 }
         self._checkMS = False
         self._fixSort = False
         self._verbose = verbose
@@ -209,7 +284,7 @@ class SDS (object):
         self.y2 = int(y2)
         self.patterns = patterns
 
-    def enableScart(self, destinationSDS):
+    def enableScart(self, destinationSDS, native = True):
         if self._fixSort:
             raise Exception("Cannot clone while fixing sorting issues.")
 
@@ -220,10 +295,14 @@ class SDS (object):
             sys.exit()
         self._scartSDS = destinationSDS
         self._runScart = True
+        self._nativeScart = native
 
     def enablecheckMS(self):
         self._checkMS = True
 
+    def enableCheckCache(self, filename):
+        self._cache = CheckCache(filename)
+
     def enableFixSort(self):
         if self._runScart:
             raise Exception("Cannot fix sorting issues while clonning.")
@@ -234,10 +313,44 @@ class SDS (object):
 
     def _scart(self, infile):
         cmd = "cat %s | scart %s" % (infile, self._scartSDS)
-        os.system(cmd)
+        if os.system(cmd) != 0:
+            print >>self._logfile," scart:: failed cloning %s" % infile
+            return 0
+        return os.path.getsize(infile)
+
+    def _clone(self, infile):
+        start = time.time()
+        if self._nativeScart:
+            if self._cloner is None:
+                self._cloner = SDSCloner(self._scartSDS)
+            try:
+                before = self._cloner.bytes
+                self._cloner.add(infile)
+                size = self._cloner.bytes - before
+            except Exception as e:
+                print >>self._logfile," clone:: failed cloning %s (%s)" % (infile, str(e))
+                size = 0
+        else:
+            size = self._scart(infile)
+        self._clonestats['files'] += 1
+        self._clonestats['bytes'] += size
+        self._clonestats['seconds'] += time.time() - start
+
+    def _closeclone(self):
+        if self._cloner is not None:
+            start = time.time()
+            self._cloner.close()
+            self._cloner = None
+            self._clonestats['seconds'] += time.time() - start
 
     def _sort(self, infile):
-        subprocess.call(["dataselect","-Pr","-rep","-mod", "-nb",infile], stdout=self._logfile, stderr=self._logfile)
+        ## Sort records and prune duplicates in place (was dataselect -Pr -rep -mod -nb)
+        try:
+            (records, pruned, rewritten) = mssort.sort_file(infile)
+        except Exception as e:
+            print >>self._logfile," sort:: failed sorting %s (%s)" % (infile, str(e))
+            return
+        print >>self._logfile," sort:: %d records, %d duplicates pruned%s" % (records, pruned, ", file rewritten" if rewritten else ", already in order")
 
     def runone(self, fileitem):
         print >>self._logfile,"Starting ONE Job @ %s" % str(datetime.datetime.now())
@@ -248,18 +361,87 @@ class SDS (object):
         filename = os.path.basename(fileitem)
         root = os.path.dirname(fileitem)
 
+        self.runshard(root, [ filename ])
+
+
+    def __getstate__(self):
+        ## Sent to the worker processes without the log file
+        state = self.__dict__.copy()
+        state['_logfile'] = None
+        return state
+
+    def _match(self, year, eachfile):
+        ## If a pattern is given, then check if file name matches the given pattern and also the year
+        if (self.patterns) and "".join(eachfile.split(".")[5]) == str(year):
+            for pattern in self.patterns :
+                if re.match(pattern, ".".join(eachfile.split(".")[0:4])):
+                    return True
+            return False
+        return True
+
+    def shards(self):
+        ## (year, folder, files) of each folder with files, only for the
+        ## years that exist, in a fixed (sorted) order
+        years = []
+        for name in os.listdir(self.path):
+            if name.isdigit() and self.y1 <= int(name) <= self.y2 and os.path.isdir(os.path.join(self.path, name)):
+                years.append(int(name))
+
+        for year in sorted(years):
+            for root, dirs, files in os.walk(os.path.join(self.path, str(year))):
+                dirs.sort()
+                files = [ f for f in sorted(files) if self._match(year, f) ]
+                if files:
+                    yield (year, root, files)
+
+    def checkfile(self, root, eachfile):
+        ## Check / sort one file, logging to self._logfile
         if self._checkMS:
-            ms = MSFile(directory=root, filename=filename, logfile=self._logfile, verbose=self._verbose)
+            testboard = self._check(root, eachfile)
 
             ## Fix Sorting issues
-            if self._fixSort and 'checkSequence' in ms.tests() and not ms.testSucceed('checkSequence'):
-                self._sort(os.path.join(root, filename))
-            del ms
-
-        pass
+            if self._fixSort and testboard.get('checkSequence') is False:
+                self._sort(os.path.join(root,eachfile))
+
+    def runshard(self, root, files):
+        ## Check / sort / clone the files of one folder, logging to self._logfile
+        for eachfile in files:
+            self.checkfile(root, eachfile)
+
+            ## Run Scart clonning
+            if self._runScart:
+                self._clone(os.path.join(root,eachfile))
+
+        self._closeclone()
+        if self._cache is not None:
+            self._cache.commit()
+
+    def _check(self, root, eachfile):
+        ## Check one file, or replay the cached result if it did not change
+        fullpath = os.path.join(root, eachfile)
+        if self._cache is not None:
+            cached = self._cache.lookup(fullpath, self._verbose)
+            if cached is not None:
+                (testboard, log) = cached
+                self._logfile.write(log)
+                return testboard
+
+        buf = StringIO()
+        ms = MSFile(directory=root, filename=eachfile, logfile=buf, verbose=self._verbose)
+        testboard = dict(ms._testboard)
+        failed = ms._failed
+        del ms
+
+        self._logfile.write(buf.getvalue())
+        self._logfile.flush()
 
+        ## Failed checks (IOError, mmap, ...) may be transient, they are
+        ## run again next time instead of being replayed from the cache
+        if self._cache is not None and testboard and not failed:
+            self._cache.store(fullpath, self._verbose, testboard, buf.getvalue())
+        return testboard
 
-    def run(self):
+    def run(self, jobs = 1):
         if self.path is None or not os.path.isdir(self.path):
             raise Exception("Folder '%s' is invalid" % self.path)
 
@@ -268,40 +450,64 @@ class SDS (object):
 
         print >>self._logfile,"Starting Job @ %s" % str(datetime.datetime.now())
         self._logfile.flush()
-        for year in range(self.y1, self.y2 + 1):
-            print >>self._logfile,"Starting Year %04d @ %s" % (year, str(datetime.datetime.now()))
-            tree=os.walk(os.path.join(self.path,str(year)))
-            for root, _, files in tree:
-                files.sort()
-                for eachfile in files:
-
-                    ## If a pattern is given, then check if file name matches the given pattern and also the year
-                    if (self.patterns) and "".join(eachfile.split(".")[5]) == str(year):
-                        match = False
-                        for pattern in self.patterns :
-                            if re.match(pattern, ".".join(eachfile.split(".")[0:4])):
-                                match = True
-                        if not match:
-                            continue
-
-                    print >>sys.stderr, os.path.join(root,eachfile)
-
-                    ## Run Checks
-                    if self._checkMS:
-                        ms = MSFile(directory=root, filename=eachfile, logfile=self._logfile, verbose=self._verbose)
-
-                        ## Fix Sorting issues
-                        if self._fixSort and 'checkSequence' in ms.tests() and not ms.testSucceed('checkSequence'):
-                            self._sort(os.path.join(root,eachfile))
-                        del ms
-
-                    ## Run Scart clonning
-                    if self._runScart:
-                        self._scart(os.path.join(root,eachfile))
+
+        lastyear = [ None ]
+        def starting(year, root, files):
+            if year != lastyear[0]:
+                print >>self._logfile,"Starting Year %04d @ %s" % (year, str(datetime.datetime.now()))
+                lastyear[0] = year
+            for eachfile in files:
+                print >>sys.stderr, os.path.join(root,eachfile)
+
+        if jobs > 1:
+            ## Folders are checked (and sorted) in parallel by the pool,
+            ## their logs come back in the same order as a serial run.
+            ## Records of one folder may go to the day files of another
+            ## (codes or times not matching the file), so clonning is
+            ## only done here, by this process, file after file as on
+            ## a serial run.
+            pool = multiprocessing.Pool(jobs)
+            try:
+                for (shard, logs) in pool.imap(_runshard, ((self, shard) for shard in self.shards())):
+                    starting(*shard)
+                    (year, root, files) = shard
+                    for (eachfile, log) in zip(files, logs):
+                        self._logfile.write(log)
+                        if self._runScart:
+                            self._clone(os.path.join(root,eachfile))
+                    self._closeclone()
+                    self._logfile.flush()
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for (year, root, files) in self.shards():
+                starting(year, root, files)
+                self.runshard(root, files)
+
+        if self._runScart:
+            stats = self._clonestats
+            seconds = max(stats['seconds'], 1e-6)
+            print >>self._logfile,"Cloned %d files, %.1f MB in %.1fs with %s (%.1f files/s, %.2f MB/s)" % (
+                stats['files'], stats['bytes'] / 1e6, stats['seconds'], "the native cloner" if self._nativeScart else "scart",
+                stats['files'] / seconds, stats['bytes'] / 1e6 / seconds)
 
         print >>self._logfile,"Job Done @ %s" % str(datetime.datetime.now())
         self._logfile.flush()
 
+def _runshard(args):
+    ## Worker: check / sort one folder, returns the log of each file
+    ## (clonning is left to the parent process)
+    (sds, shard) = args
+    logs = []
+    for eachfile in shard[2]:
+        sds._logfile = StringIO()
+        sds.checkfile(shard[1], eachfile)
+        logs.append(sds._logfile.getvalue())
+    if sds._cache is not None:
+        sds._cache.commit()
+    return (shard, logs)
+
 def _error(message):
     print >>LOG_FILE," ",message
 
@@ -334,6 +540,9 @@ if __name__ == '__main__':
     parser.add_option("-d","--destination-sds", type="string", dest="destination_sds",
                       help="Non-existing folder that will contain the cloned/cleanned destination SDS (set this option to enable the clonning).", default=None)
 
+    parser.add_option("", "--use-scart", action="store_true", dest="use_scart",
+                      help="Clone with 'cat file | scart' for each file instead of the native cloner (for comparison).", default=False)
+
     parser.add_option("","--start-year", type="string", dest="start_year",
                       help="Start Year to run in the form y1[:y2] (Defaults to 1980)", default=None)
 
@@ -344,19 +553,25 @@ if __name__ == '__main__':
     parser.add_option("-n", "--no-check", action="store_false", dest="check",
                       help="Disable checking the input files", default=True)
 
+    parser.add_option("-c", "--check-cache", type="string", dest="check_cache",
+                      help="SQLite file caching the check results, files not changed (size, mtime, inode) since they were checked are not read again.", default=None)
+
     parser.add_option("", "--sort", action="store_true", dest="sort",
-                      help="Enable file sorting inplace, will use the dataselect tool from IRIS (options -Pr/-rep).", default=False)
+                      help="Enable file sorting inplace (records sorted by time and exact duplicates removed, like dataselect -Pr -rep).", default=False)
 
     parser.add_option("-p","--pattern", type="string", dest="patternList",
                       help="Pattern to search and fix files", default=None)
 
+    parser.add_option("-j", "--jobs", type="int", dest="jobs",
+                      help="Number of processes checking folders in parallel (logs keep the serial order, clonning stays in the main process).", default=1)
+
     parser.add_option("-v", "--verbose", action="store_true", dest="verbose",
                       help="Be verbose in check reports.", default=False)
 
     ## Parse CMD LINE
     (options, args) = parser.parse_args()
 
-    ## Attach error log to catch failures from mseedlite
+    ## Attach error log to catch failures from seiscomp
     logs.error = _error
     if options.log_file:
         LOG_FILE = file(options.log_file, "a")
@@ -423,12 +638,15 @@ if __name__ == '__main__':
 
     ## Enable the clone
     if options.destination_sds:
-        sds.enableScart(options.destination_sds)
+        sds.enableScart(options.destination_sds, not options.use_scart)
 
     ## Enable the check while processing
     if options.check:
         sds.enablecheckMS()
 
+    if options.check_cache:
+        sds.enableCheckCache(options.check_cache)
+
     if options.sort:
         sds.enableFixSort()
 
@@ -437,7 +655,7 @@ if __name__ == '__main__':
         if options.one_file:
             sds.runone(options.one_file)
         else:
-            sds.run()
+            sds.run(max(1, options.jobs))
     except Exception as e:
         _error("Could not start job, %s" % str(e))
 
@@ -29,17 +29,66 @@
 # that does not touch source or destination files, but only 
 # simulate
 #
+# Destination files are written to a temporary file in the same
+# folder and renamed into place, so an interrupted run never leaves
+# a truncated day file. Each source file done is recorded in a
+# journal on the source SDS before being removed: running again
+# after an interruption only removes (or skips) the files already
+# done, without checking and merging them again.
+#
+# Using -j N the files are processed by a pool of N processes.
+# Source files that go to the same destination file are handled
+# in order and one at a time, so a destination file is never
+# written by two processes at the same time.
+#
+# Depends on: numpy, obspy, mscheck.py and msheader.py (installed
+#             in the same folder)
+#
 #######
 
 import datetime
+import time
 import sys
-import mseedlite
-from os import walk, sep, path, makedirs as mkdir, remove
+import json
+import mscheck
+import msheader
+import os
+from os import path, listdir, stat, getpid, rename, fsync, makedirs as mkdir, remove
 from optparse import OptionParser
 from shutil import copyfile as cp
-from obspy.core import UTCDateTime, read, stream
+import numpy as np
+from obspy.core import UTCDateTime, Trace, read, stream
 from genericpath import isdir
 import signal
+import heapq
+import sqlite3
+import multiprocessing
+from StringIO import StringIO
+from io import BytesIO
+from contextlib import contextmanager
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+try:
+    from xxhash import xxh64 as hashfunction
+    HASHNAME = "xxh64"
+except ImportError:
+    try:
+        from hashlib import blake2b as hashfunction
+        HASHNAME = "blake2b"
+    except ImportError:
+        try:
+            from pyblake2 import blake2b as hashfunction
+            HASHNAME = "blake2b"
+        except ImportError:
+            from hashlib import sha1 as hashfunction
+            HASHNAME = "sha1"
 
 try:
     from iaghacks import Postman
@@ -49,6 +98,7 @@ except:
 
 VERSION = "0.1"
 FORCESTOP = False
+STOPEVENT = None
 
 class Logs(object):
     DEBUG = 0
@@ -97,30 +147,180 @@ def signal_handler(signal, frame):
 
     logerror('*** Wait, preparing to stop ***')
     FORCESTOP = True
+    if STOPEVENT is not None:
+        STOPEVENT.set()
     return
 
+class SourceFile(object):
+    
+    # A source file read only once: the raw bytes are kept in memory,
+    # check_file() runs over them and fills the record index, and
+    # execute_merge() decodes / copies from the same bytes.
+    #
+    # Large files (inmemory False) are never loaded: they are mapped,
+    # only their headers are decoded (msheader.py) and each pass
+    # copies one record at a time.
+    #
+    def __init__(self, filename, inmemory = True):
+        self.filename = filename
+        self.inmemory = inmemory
+        self.data = None
+        self.records = [ ]   # (offset, length, begin_time, end_time, fsamp)
+
+    def load(self):
+        if self.data is None:
+            fd = open(self.filename, "rb")
+            try:
+                self.data = fd.read()
+            finally:
+                fd.close()
+        return self.data
+
+    def open(self):
+        if self.data is None and not self.inmemory:
+            return open(self.filename, "rb")
+        return BytesIO(self.load())
+
+    def size(self):
+        if self.data is not None:
+            return len(self.data)
+        return path.getsize(self.filename)
+
+    def fingerprint(self):
+        if self.data is not None or self.inmemory:
+            return fingerprint(self.load())
+
+        h = hashfunction()
+        fd = open(self.filename, "rb")
+        try:
+            for chunk in iter(lambda: fd.read(1 << 20), ""):
+                h.update(chunk)
+        finally:
+            fd.close()
+        return "%s:%s" % (HASHNAME, h.hexdigest())
+
+    def iter_raw(self):
+        # Iterate over (begin_time, end_time, fsamp, raw bytes) of each
+        # record, holding only one record in memory (the file is
+        # mapped, not read, when not in memory)
+        #
+        if self.data is not None or self.inmemory:
+            data = self.load()
+            for (offset, length, begin, end, fsamp) in self.index():
+                yield (begin, end, fsamp, data[offset:offset + length])
+            return
+
+        with msheader.mapped(self.filename) as headers:
+            for (offset, length, begin, end, fsamp) in self._index(headers.records()):
+                yield (begin, end, fsamp, headers.buf[offset:offset + length])
+
+    def _index(self, hdr):
+        return zip(hdr["offset"].tolist(), hdr["length"].tolist(),
+                   msheader.datetimes(hdr["begin"]), msheader.datetimes(hdr["end"]), hdr["fsamp"].tolist())
+
+    def headers(self):
+        # Record header array (msheader.RECORD) while building the
+        # record index. Only the headers are decoded, from the bytes in
+        # memory or from a map of the file.
+        #
+        if self.data is not None or self.inmemory:
+            hdr = msheader.scan(self.load())
+        else:
+            hdr = msheader.read(self.filename)
+        self.records = self._index(hdr)
+        return hdr
+
+    def index(self):
+        # Record index, decoding the headers if check_file did not
+        #
+        if not self.records:
+            self.headers()
+        return self.records
+
+    def read(self):
+        return read(self.open())
+
+class _Entry(object):
+    
+    # Minimal DirEntry for when scandir is not available
+    #
+    def __init__(self, folder, name):
+        self.name = name
+        self.path = path.join(folder, name)
+        self._stat = None
+
+    def is_symlink(self):
+        return path.islink(self.path)
+
+    def is_dir(self):
+        return path.isdir(self.path)
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = stat(self.path)
+        return self._stat
+
+def scan_folder(folder):
+    
+    # Entries of a folder sorted by name (errors are ignored, as in walk)
+    #
+    try:
+        if scandir is not None:
+            entries = list(scandir(folder))
+        else:
+            entries = [ _Entry(folder, name) for name in listdir(folder) ]
+    except OSError:
+        return [ ]
+
+    entries.sort(key = lambda e: e.name)
+    return entries
+
+def iter_sds(folder):
+    
+    # Yield the entries of all files below folder lazily, in SDS order
+    # (year/net/sta/chan/day). Like walk, links to folders are not
+    # followed. Hidden entries (like the destination index) are skipped.
+    #
+    for entry in scan_folder(folder):
+        if entry.name.startswith("."):
+            continue
+
+        try:
+            isdir = entry.is_dir()
+        except OSError:
+            isdir = False
+
+        if isdir:
+            if not entry.is_symlink():
+                for subentry in iter_sds(entry.path):
+                    yield subentry
+        else:
+            yield entry
+
 def get_filelist(sourcefolder, mode):
-    fileList=[]
     
+    # Generator of source files, in SDS order. In NRT mode only files
+    # not modified since yesterday midnight (local time) are returned.
+    #
     if mode == Mode.NRT:
         now = datetime.datetime.now().date()
         time2cut = datetime.datetime.strptime(str(now)+"-00-00", "%Y-%m-%d-%H-%M") - datetime.timedelta(days=1)
-    
-        for root, dirs, files in walk(sourcefolder):
-            for msFile in files:
-                mtime = datetime.datetime.fromtimestamp(path.getmtime(root+sep+msFile))
-                if mtime < time2cut :
-                    fileList.append(root+sep+msFile)
+        cut = time.mktime(time2cut.timetuple())
+
+        for entry in iter_sds(sourcefolder):
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if mtime < cut:
+                yield entry.path
     elif mode == Mode.ARCHIVE:
-        for root, dirs, files in walk(sourcefolder):
-            for msFile in files:
-                fileList.append(root+sep+msFile)
+        for entry in iter_sds(sourcefolder):
+            yield entry.path
     else:
         logerror("Invalid mode of operation")
 
-    return sorted(fileList)
-
-def check_file(sourcefolder, currentfile):
+def check_file(sourcefolder, currentfile, source = None):
     filename = path.basename(currentfile)
     status = CheckStatus.ALLOK
 
@@ -171,66 +371,39 @@ def check_file(sourcefolder, currentfile):
 
     # Headers match name
     #
-    infile = file(path.join(currentfile))
-    records = mseedlite.Input(infile)
+    if source is None: source = SourceFile(currentfile)
+    hdr = source.headers()
 
     morning = datetime.datetime.now().strptime("%s-%sT%s:%s:%s" % (year, jday, 0,0,0),"%Y-%jT%H:%M:%S")
     evening = morning + datetime.timedelta(days = 1)
 
-    lastrecord = None
+    # Each problem is reported once, in the order it first shows up
+    # on the file
+    #
+    problems = [ ]
+    mismatch = mscheck.code_mismatch(hdr, network, station, location, channel)
+    for (rank, (code, name)) in enumerate([ ("net", "network"), ("sta", "station"), ("loc", "location"), ("cha", "channel") ]):
+        problems.append((mscheck.first(mismatch[code]), rank, CheckStatus.NOSYC, logerror, "Invalid header %s code." % name))
 
-    wnet = False
-    wsta = False
-    wloc = False
-    wcha = False
-    worder = False 
-    wlast = False
-    wlastover = False
+    problems.append((mscheck.first(mscheck.outside_day(hdr, morning, evening, True)), 4, CheckStatus.NOSYC, logerror, "Record does not fit day."))
 
-    for record in records:
-        # Check Codes
-        #
-        if network  != record.net and not wnet:
-            status = max(status, CheckStatus.NOSYC)
-            logerror("%s: Invalid header network code." % filename)
-            wnet = True
-
-        if station  != record.sta and not wsta:
-            status = max(status, CheckStatus.NOSYC)
-            logerror("%s: Invalid header station code." % filename)
-            wsta = True
-
-        if location != record.loc and not wloc:
-            status = max(status, CheckStatus.NOSYC)
-            logerror("%s: Invalid header location code." % filename)
-            wloc = True
-
-        if channel  != record.cha and not wcha:
-            status = max(status, CheckStatus.NOSYC)
-            logerror("%s: Invalid header channel code." % filename)
-            wcha = True
-
-        # Fits day
-        #
-        if record.begin_time < morning or record.begin_time > evening and not worder:
-            status = max(status, CheckStatus.NOSYC)
-            logerror("%s: Record does not fit day." % filename)
-            worder = True
+    # Ordered: after the first record out of order, the next ones
+    # count as possible overlaps
+    #
+    seq = mscheck.sequence(hdr, 4.0)
+    back = (seq != mscheck.INORDER) & (seq < mscheck.INSIDE)
+    worder = mscheck.first(back)
+    overlap = seq >= mscheck.INSIDE
+    if worder is not None:
+        overlap |= back
+        overlap[worder] = False
 
-        # Ordered
-        #
-        _dt2 = datetime.timedelta(0, 1.0 / record.fsamp / 4.0)
-        if lastrecord:
-            if (record.begin_time + _dt2) < lastrecord.begin_time and not wlast:
-                status = max(status, CheckStatus.FORCESORT)
-                logwarning("%s: Records out of order." % filename)
-                wlast = True
-            elif (record.begin_time + _dt2) < lastrecord.end_time and not wlastover:
-                logwarning("%s: Possible Overlapping records." % filename)
-                wlastover = True
-
-        lastrecord = record
-    infile.close()
+    problems.append((worder, 5, CheckStatus.FORCESORT, logwarning, "Records out of order."))
+    problems.append((mscheck.first(overlap), 6, CheckStatus.ALLOK, logwarning, "Possible Overlapping records."))
+
+    for (index, rank, level, log, message) in sorted([ p for p in problems if p[0] is not None ]):
+        status = max(status, level)
+        log("%s: %s" % (filename, message))
 
     return status
 
@@ -245,39 +418,544 @@ def ensure_folder(folder):
            
             pass
 
-def cansimplemerge(stream):
-    sps = None
-    for t in stream:
-        if sps is None:
-            sps = t.stats.sampling_rate
-        if t.stats.sampling_rate != sps:
+def sync_path(name):
+    fd = os.open(name, os.O_RDONLY)
+    try:
+        fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_staged(filename, writer):
+    
+    # Atomically replace filename: writer(tmpname) writes a hidden
+    # temporary file in the same folder, that is flushed to disk and
+    # renamed over filename. On failure, or if writer returns False,
+    # filename is left untouched. Returns True when replaced.
+    #
+    tmpname = path.join(path.dirname(filename), ".%s.%d.tmp" % (path.basename(filename), getpid()))
+    try:
+        if writer(tmpname) is False:
+            remove(tmpname)
             return False
+        sync_path(tmpname)
+        rename(tmpname, filename)
+    except:
+        if path.isfile(tmpname): remove(tmpname)
+        raise
+
+    # Make the rename itself durable
+    #
+    try:
+        sync_path(path.dirname(filename) or ".")
+    except OSError:
+        pass
+
     return True
 
-def multimerge(st):
+def write_file(filename, data):
+    def writer(tmpname):
+        fd = open(tmpname, "wb")
+        try:
+            fd.write(data)
+        finally:
+            fd.close()
+    write_staged(filename, writer)
+
+def merge_run(pieces):
+
+    # Join the pieces (trace, first sample) of one run in a single
+    # preallocated array
     #
-    # Split streams by sps !
+    first = pieces[0][0]
+    dtype = np.result_type(*[ t.data.dtype for (t, skip) in pieces ])
+    data = np.empty(sum([ t.stats.npts - skip for (t, skip) in pieces ]), dtype = dtype)
+    i = 0
+    for (t, skip) in pieces:
+        n = t.stats.npts - skip
+        data[i:i + n] = t.data[skip:]
+        i += n
+
+    if len(pieces) == 1:
+        return first
+
+    return Trace(data = data, header = first.stats.copy())
+
+def merge_traces(st, misalignment = 0.25):
+
+    # Sample level merge of a stream, replacing ObsPy merge(method=-1)
+    # per sampling rate: traces are grouped by (id, sampling rate) in
+    # one pass and sorted once by start time. Contiguous traces (within
+    # misalignment samples) are joined, overlaps are joined only when
+    # the overlapping samples are identical, anything else is kept as
+    # a separate trace. Days where the sampling rate changes (RT130
+    # reconfigurations) give one set of traces per rate.
     #
-    streams = { }
-    while st:
-        trone = st.pop()
-        sps = trone.stats.sampling_rate
-        try:
-            ts = streams[sps]
-        except KeyError:
-            ts = stream.Stream()
-            streams[sps] = ts
-        ts.append(trone)
-    
+    groups = { }
+    for t in st:
+        groups.setdefault((t.id, t.stats.sampling_rate), [ ]).append(t)
+
     merged = stream.Stream()
-    for t in streams.keys():
-        streams[t].merge(method=-1, misalignment_threshold = 0.25)
-        merged += streams[t]
-        del streams[t]
+    for (key, traces) in sorted(groups.items()):
+        traces.sort(key = lambda t: t.stats.starttime)
+        delta = traces[0].stats.delta
+
+        pieces = None
+        for t in traces:
+            if t.stats.npts == 0: continue
+
+            if pieces is None:
+                pieces = [ (t, 0) ]
+                last = pieces[-1][0]
+                continue
+
+            # Position of t relative to the sample following the run
+            #
+            offset = (t.stats.starttime - last.stats.endtime) / delta - 1.0
+            k = int(round(offset))
+            if abs(offset - k) <= misalignment:
+                if k == 0:
+                    pieces.append((t, 0))
+                    last = t
+                    continue
+
+                # Overlap inside the last trace of the run
+                #
+                n = -k
+                if 0 < n <= last.stats.npts:
+                    tail = last.data[last.stats.npts - n:][:t.stats.npts]
+                    if np.array_equal(tail, t.data[:len(tail)]):
+                        if t.stats.npts > n:
+                            pieces.append((t, n))
+                            last = t
+                        continue
+
+            merged.append(merge_run(pieces))
+            pieces = [ (t, 0) ]
+            last = t
+
+        if pieces is not None:
+            merged.append(merge_run(pieces))
+
+    return merged
+
+def record_merge(sources):
     
+    # Record level merge: splice the raw records of all sources by
+    # time, copying them byte by byte (no decompression). Exact
+    # duplicates (same times and same bytes after the sequence number
+    # and quality flag) are dropped, the first source wins.
+    #
+    # Returns the merged file (an in memory SourceFile, with its record
+    # index), or None when records really overlap or sampling rates
+    # differ and a sample level merge (ObsPy) is needed.
+    #
+    records = [ ]
+    for source in sources:
+        data = source.load()
+        for (offset, length, begin, end, fsamp) in source.index():
+            records.append((begin, end, fsamp, data[offset:offset + length]))
+
+    records.sort(key = lambda r: (r[0], r[1]))
+
+    merged = SourceFile(None)
+    chunks = [ ]
+    offset = 0
+    last = None
+    for record in records:
+        (begin, end, fsamp, raw) = record
+        if not fsamp or fsamp <= 0:
+            return None
+
+        if last is not None:
+            if fsamp != last[2]:
+                return None
+
+            if begin == last[0] and end == last[1] and raw[8:] == last[3][8:]:
+                continue
+
+            _dt2 = datetime.timedelta(0, 1.0 / fsamp / 4.0)
+            if (begin + _dt2) < last[1]:
+                return None
+
+        chunks.append(raw)
+        merged.records.append((offset, len(raw), begin, end, fsamp))
+        offset += len(raw)
+        last = record
+
+    merged.data = "".join(chunks)
     return merged
 
-def execute_merge(currentfile, destinationfolder, mode, forcekeep, forcedelete, forcesort, dryrun):
+class StreamAbort(Exception):
+    pass
+
+def iter_sorted(i, source):
+    
+    # Records of source i for the k-way merge, which needs each
+    # source in time order
+    #
+    last = None
+    for (n, (begin, end, fsamp, raw)) in enumerate(source.iter_raw()):
+        if last is not None and (begin, end) < last:
+            raise StreamAbort("records out of order on %s" % source.filename)
+        last = (begin, end)
+        yield (begin, end, i, n, fsamp, raw)
+
+def stream_merge(sources, fd):
+    
+    # Bounded memory version of record_merge: a k-way merge over the
+    # record iterators of the sources, writing each record to fd as
+    # soon as it is known to go in the output. Only one record per
+    # source is held in memory, whatever the size of the day files.
+    #
+    # Raises StreamAbort when a source is out of order or when a sample
+    # level merge is needed (overlaps, sampling rate changes). Returns
+    # (changed, nrecords, begin, end, fingerprint), changed is False
+    # when the output is just the first source (the destination).
+    #
+    digest = hashfunction()
+    changed = len(sources) == 1
+    nrecords = 0
+    first = None
+    last = None
+    for record in heapq.merge(*[ iter_sorted(i, source) for (i, source) in enumerate(sources) ]):
+        (begin, end, i, n, fsamp, raw) = record
+        if not fsamp or fsamp <= 0:
+            raise StreamAbort("invalid sampling rate")
+
+        if last is not None:
+            if fsamp != last[4]:
+                raise StreamAbort("sampling rate changes")
+
+            if begin == last[0] and end == last[1] and raw[8:] == last[5][8:]:
+                if i == 0: changed = True
+                continue
+
+            _dt2 = datetime.timedelta(0, 1.0 / fsamp / 4.0)
+            if (begin + _dt2) < last[1]:
+                raise StreamAbort("records overlap")
+
+        if i != 0: changed = True
+        fd.write(raw)
+        digest.update(raw)
+        nrecords += 1
+        if first is None: first = begin
+        last = record
+
+    return (changed, nrecords, first, last[1] if last else None, "%s:%s" % (HASHNAME, digest.hexdigest()))
+
+def fingerprint(data):
+    return "%s:%s" % (HASHNAME, hashfunction(data).hexdigest())
+
+class DestinationIndex(object):
+    
+    # Fingerprints of the destination SDS files (size, mtime, record
+    # count, time span and content hash), kept in a SQLite file on the
+    # destination root. When the size and mtime of a destination file
+    # still match its entry, the hash can be trusted without reading
+    # the file: a source with the same hash is a no-op merge.
+    #
+    # Each update is one transaction, so the index is always consistent.
+    # Connections are opened per process (the -j workers have their own).
+    #
+    FILENAME = ".sdsmerge.db"
+
+    def __init__(self, folder, readonly = False):
+        self.folder = folder
+        self.filename = path.join(folder, DestinationIndex.FILENAME)
+        self.readonly = readonly
+        self._db = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Sent to the -j workers without the connection
+        #
+        state = self.__dict__.copy()
+        state["_db"] = None
+        return state
+
+    def db(self):
+        if self._db is None or self._pid != getpid():
+            if self.readonly and not path.isfile(self.filename):
+                return None
+            self._db = sqlite3.connect(self.filename, timeout = 60)
+            self._pid = getpid()
+            if not self.readonly:
+                with self._db:
+                    self._db.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER, mtime REAL, nrecords INTEGER, begin TEXT, end TEXT, hash TEXT)")
+        return self._db
+
+    def key(self, sdsFile):
+        return path.relpath(sdsFile, self.folder)
+
+    def lookup(self, sdsFile):
+        db = self.db()
+        if db is None: return None
+        try:
+            row = db.execute("SELECT size, mtime, nrecords, begin, end, hash FROM files WHERE name = ?", (self.key(sdsFile),)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        if row is None: return None
+        return dict(zip(("size", "mtime", "nrecords", "begin", "end", "hash"), row))
+
+    def is_current(self, sdsFile, entry):
+        try:
+            st = stat(sdsFile)
+        except OSError:
+            return False
+        return entry["size"] == st.st_size and entry["mtime"] == st.st_mtime
+
+    def matches(self, sdsFile, source):
+        # True when sdsFile is known to hold exactly the source bytes
+        #
+        entry = self.lookup(sdsFile)
+        if entry is None or not self.is_current(sdsFile, entry):
+            return False
+        return entry["size"] == source.size() and entry["hash"] == source.fingerprint()
+
+    def update(self, sdsFile, content = None):
+        # Record the fingerprint of sdsFile just written. content is the
+        # SourceFile that was written (read back from disk if None).
+        #
+        if self.readonly: return
+        if content is None: content = SourceFile(sdsFile, False)
+        records = content.index()
+        begin = min([ r[2] for r in records ]) if records else None
+        end = max([ r[3] for r in records ]) if records else None
+        self.store(sdsFile, len(records), begin, end, content.fingerprint())
+
+    def store(self, sdsFile, nrecords, begin, end, digest):
+        if self.readonly: return
+        st = stat(sdsFile)
+        with self.db():
+            self.db().execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (self.key(sdsFile), st.st_size, st.st_mtime, nrecords,
+                               begin.isoformat() if begin else None, end.isoformat() if end else None, digest))
+
+class Journal(object):
+    
+    # Source files already synchronized by this run, kept on the source
+    # SDS (one "size mtime name" line per file, appended before the
+    # file is removed). An entry is only trusted while the source file
+    # keeps its size and mtime. The journal is removed when a run
+    # finishes.
+    #
+    FILENAME = ".sdsmerge.journal"
+
+    def __init__(self, folder, readonly = False):
+        self.folder = folder
+        self.filename = path.join(folder, Journal.FILENAME)
+        self.readonly = readonly
+        self._entries = None
+        self._fd = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Sent to the -j workers, each one loads and appends on its own
+        #
+        state = self.__dict__.copy()
+        state["_entries"] = None
+        state["_fd"] = None
+        return state
+
+    def key(self, filename):
+        return path.relpath(filename, self.folder)
+
+    def entries(self):
+        if self._entries is None or self._pid != getpid():
+            self._entries = { }
+            self._fd = None
+            self._pid = getpid()
+            if path.isfile(self.filename):
+                fd = open(self.filename)
+                try:
+                    for line in fd:
+                        items = line.rstrip("\n").split(" ", 2)
+                        if len(items) != 3: continue
+                        try:
+                            self._entries[items[2]] = (int(items[0]), float(items[1]))
+                        except ValueError:
+                            continue
+                finally:
+                    fd.close()
+        return self._entries
+
+    def __len__(self):
+        return len(self.entries())
+
+    def done(self, filename):
+        entry = self.entries().get(self.key(filename))
+        if entry is None: return False
+        try:
+            st = stat(filename)
+        except OSError:
+            return False
+        return entry == (st.st_size, st.st_mtime)
+
+    def record(self, filename, st):
+        # st is the stat of the source file before it was merged
+        #
+        if self.readonly: return
+        self.entries()[self.key(filename)] = (st.st_size, st.st_mtime)
+        if self._fd is None:
+            self._fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        os.write(self._fd, "%d %r %s\n" % (st.st_size, st.st_mtime, self.key(filename)))
+        fsync(self._fd)
+
+    def clear(self):
+        if self.readonly: return
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._entries = None
+        if path.isfile(self.filename): remove(self.filename)
+
+def remove_source(currentfile, mode, forcekeep, forcedelete, dryrun):
+    
+    # Remove origin file if asked to. Returns (removed, failed)
+    #
+    if (mode == Mode.NRT and not forcekeep) or (mode == Mode.ARCHIVE and forcedelete):
+        try:
+            if not dryrun: remove(currentfile)
+            return (True, False)
+        except Exception as e:
+            logerror("Failed to execute rm %s\n (%s)" % (currentfile, str(e)))
+            return (False, True)
+
+    return (False, False)
+
+class FileReport(object):
+    
+    # Figures of one source file for the run report: check status,
+    # action taken, bytes, records and the wall time of each phase
+    #
+    PHASES = [ "enumerate", "check", "read", "merge", "write", "remove" ]
+    STATUS = { CheckStatus.ALLOK: "ALLOK", CheckStatus.FORCESORT: "FORCESORT", CheckStatus.NOSYC: "NOSYC" }
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.status = None
+        self.action = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.records = 0
+        self.phases = dict([ (p, 0.0) for p in FileReport.PHASES ])
+        self.wall = 0.0
+        self._start = time.time()
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.time() - t0
+
+    def finish(self, status):
+        self.status = FileReport.STATUS.get(status, status)
+        self.wall = time.time() - self._start
+        return self
+
+    def todict(self):
+        return { "file": self.filename, "status": self.status, "action": self.action,
+                 "bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                 "records": self.records, "wall_s": round(self.wall + self.phases["enumerate"], 6),
+                 "phases": dict([ (p, round(t, 6)) for (p, t) in self.phases.items() ]) }
+
+class RunReport(object):
+    
+    # JSON lines run report (-r): one line per file and a final
+    # summary line with the totals per phase and the throughput
+    #
+    def __init__(self, filename):
+        self.fd = open(filename, "a") if filename != "-" else sys.stdout
+        self.start = time.time()
+        self.files = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.records = 0
+        self.phases = dict([ (p, 0.0) for p in FileReport.PHASES ])
+        self.actions = { }
+
+    def add(self, report):
+        self.files += 1
+        self.bytes_read += report.bytes_read
+        self.bytes_written += report.bytes_written
+        self.records += report.records
+        for (p, t) in report.phases.items():
+            self.phases[p] += t
+        self.actions[report.action] = self.actions.get(report.action, 0) + 1
+        print >>self.fd, json.dumps(report.todict(), sort_keys = True)
+
+    def close(self, interrupted = False):
+        wall = time.time() - self.start
+        summary = { "summary": True, "interrupted": interrupted, "files": self.files,
+                    "actions": self.actions, "records": self.records,
+                    "bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                    "wall_s": round(wall, 6),
+                    "files_per_s": round(self.files / wall, 3) if wall > 0 else None,
+                    "mb_read_per_s": round(self.bytes_read / 1e6 / wall, 3) if wall > 0 else None,
+                    "mb_written_per_s": round(self.bytes_written / 1e6 / wall, 3) if wall > 0 else None,
+                    "phases": dict([ (p, round(t, 6)) for (p, t) in self.phases.items() ]) }
+        print >>self.fd, json.dumps(summary, sort_keys = True)
+        if self.fd is not sys.stdout: self.fd.close()
+        return summary
+
+def timed_files(files, elapsed):
+    
+    # Yield the files, keeping in elapsed the time spent finding each
+    # one (enumerate phase)
+    #
+    files = iter(files)
+    while True:
+        t0 = time.time()
+        try:
+            current = next(files)
+        except StopIteration:
+            return
+        elapsed[current] = time.time() - t0
+        yield current
+
+def execute_stream_merge(currentfile, sdsFile, sources, dryrun, index, report):
+    
+    # Record level merge with stream_merge, writing the destination
+    # as records come. Returns whether the destination changed, or
+    # None when the files cannot be streamed (and must be loaded).
+    #
+    result = [ ]
+    def writer(tmpname):
+        fd = open(tmpname if not dryrun else os.devnull, "wb")
+        try:
+            result.append(stream_merge(sources, fd))
+        finally:
+            fd.close()
+        return result[0][0] and not dryrun
+
+    report.bytes_read += sum([ s.size() for s in sources ])
+    with report.phase("merge"):
+        try:
+            if not dryrun:
+                write_staged(sdsFile, writer)
+            else:
+                writer(None)
+        except StreamAbort as e:
+            logwarning("Cannot stream merge file %s, loading it (%s)" % (currentfile, str(e)))
+            return None
+
+    (changed, nrecords, begin, end, digest) = result[0]
+    if changed:
+        report.action = "streammerge"
+        if not dryrun: report.bytes_written += path.getsize(sdsFile)
+    else:
+        loginfo("%s: no new records, destination unchanged" % path.basename(currentfile))
+        report.action = "unchanged"
+
+    if not dryrun and index is not None:
+        with report.phase("write"):
+            index.store(sdsFile, nrecords, begin, end, digest)
+
+    return changed
+
+def execute_merge(currentfile, destinationfolder, mode, forcekeep, forcedelete, forcesort, dryrun, source = None, index = None, journal = None, report = None, streamabove = None):
     
     # Build SDS path
     #
@@ -290,53 +968,257 @@ def execute_merge(currentfile, destinationfolder, mode, forcekeep, forcedelete,
     copied = False
     removed = False
 
+    if source is None: source = SourceFile(currentfile)
+    if report is None: report = FileReport(currentfile)
+    if journal is not None: sourcestat = stat(currentfile)
+
     # Check if destination exists. If not, make it
     # 
     if not dryrun: ensure_folder(sdsPath)
 
+    # Nothing to do if the destination already holds this exact file
+    #
+    with report.phase("merge"):
+        identical = index is not None and not forcesort and path.isfile(sdsFile) and index.matches(sdsFile, source)
+
+    if identical:
+        loginfo("%s: identical to destination, skipping" % path.basename(currentfile))
+        report.action = "identical"
+
     # Check if file exists in destination. If affirmative, merge them
     #
-    if path.isfile(sdsFile) or forcesort:
+    elif path.isfile(sdsFile) or forcesort:
         try:
-            st = read(currentfile)
-            print >>sys.stderr,currentfile
-            if path.isfile(sdsFile) and path.getsize(sdsFile) > 0:
-                st += read(sdsFile)
-            if cansimplemerge(st):
-                st.merge(method=-1)
-            else:
-                logwarning("Cannot execute a simple merge, doing a multi merge on file %s !" % currentfile)
-                st = multimerge(st)
-            st.sort(['starttime'])
+            sources = [ source ]
+            destsize = path.getsize(sdsFile) if path.isfile(sdsFile) else 0
+            streaming = not forcesort and (not source.inmemory or (streamabove is not None and source.size() + destsize > streamabove))
+            if destsize > 0:
+                sources.insert(0, SourceFile(sdsFile, not streaming))
 
-            if not dryrun: st.write(sdsFile, "MSEED")
-            merged = True
+            # Large files: bounded memory merge, straight to disk
+            #
+            streamed = None
+            if streaming:
+                streamed = execute_stream_merge(currentfile, sdsFile, sources, dryrun, index, report)
+
+            if streamed is not None:
+                merged = streamed
+            else:
+                if len(sources) > 1 and not streaming:
+                    with report.phase("read"):
+                        report.bytes_read += len(sources[0].load())
+
+                # Append / fill holes at record level when possible
+                #
+                with report.phase("merge"):
+                    try:
+                        content = record_merge(sources)
+                    except Exception as e:
+                        logwarning("Record merge failed on file %s, using ObsPy (%s)" % (currentfile, str(e)))
+                        content = None
+
+                if content is not None:
+                    if len(sources) > 1 and content.data == sources[0].data:
+                        # All source records already in destination
+                        #
+                        loginfo("%s: no new records, destination unchanged" % path.basename(currentfile))
+                        report.action = "unchanged"
+                        if not dryrun and index is not None:
+                            with report.phase("write"):
+                                index.update(sdsFile, sources[0])
+                    else:
+                        report.action = "merge"
+                        if not dryrun:
+                            with report.phase("write"):
+                                write_file(sdsFile, content.data)
+                                report.bytes_written += len(content.data)
+                                if index is not None: index.update(sdsFile, content)
+                        merged = True
+                else:
+                    # True overlaps: sample level merge with ObsPy
+                    #
+                    report.action = "samplemerge"
+                    with report.phase("read"):
+                        st = source.read()
+                        print >>sys.stderr,currentfile
+                        if len(sources) > 1:
+                            st += sources[0].read()
+
+                    with report.phase("merge"):
+                        if len(set([ t.stats.sampling_rate for t in st ])) > 1:
+                            logwarning("Sampling rate changes on file %s, merging each rate apart !" % currentfile)
+                        st = merge_traces(st)
+                        st.sort(['starttime'])
+
+                    if not dryrun:
+                        with report.phase("write"):
+                            write_staged(sdsFile, lambda tmpname: st.write(tmpname, "MSEED"))
+                            report.bytes_written += path.getsize(sdsFile)
+                            if index is not None: index.update(sdsFile)
+                    merged = True
         except Exception as e:
             logerror("Failed to execute merge %s to %s\n (%s)" % (currentfile, path.dirname(sdsFile), str(e)))
+            report.action = "error"
             return (merged, copied, removed)
 
     else:
         # Copy currentFile into destination
         #
+        report.action = "copy"
         try:
-            if not dryrun: cp(currentfile, sdsFile)
+            if not dryrun:
+                with report.phase("write"):
+                    if source.data is not None:
+                        write_file(sdsFile, source.data)
+                    else:
+                        write_staged(sdsFile, lambda tmpname: cp(currentfile, tmpname))
+                    report.bytes_written += path.getsize(sdsFile)
+                    if index is not None: index.update(sdsFile, source)
             copied = True
         except Exception as e:
             logerror("Failed to execute cp %s to %s\n (%s)" % (currentfile, path.dirname(sdsFile), str(e)))
+            report.action = "error"
             return (merged, copied, removed)
 
-    # Remove origin file if asked to
-    #
-    if (mode == Mode.NRT and not forcekeep) or (mode == Mode.ARCHIVE and forcedelete):
-        try:
-            if not dryrun: remove(currentfile)
-            removed = True
-        except Exception as e:
-            logerror("Failed to execute rm %s\n (%s)" % (currentfile, str(e)))
-            return (merged, copied, removed)
+    with report.phase("remove"):
+        # Destination is safe, journal it before removing the source
+        #
+        if journal is not None and not dryrun:
+            try:
+                journal.record(currentfile, sourcestat)
+            except Exception as e:
+                logwarning("Failed to journal %s (%s)" % (currentfile, str(e)))
+
+        (removed, failed) = remove_source(currentfile, mode, forcekeep, forcedelete, dryrun)
 
     return (merged, copied, removed)
 
+def sync_file(current, options):
+    
+    # Check and synchronize one source file, reading it only once.
+    # Returns (status, merged, copied, removed, report)
+    #
+    report = FileReport(current)
+
+    # Done by an interrupted run, at most the removal is missing
+    #
+    if options.journal is not None and options.journal.done(current):
+        report.action = "resumed"
+        with report.phase("remove"):
+            (removed, failed) = remove_source(current, options.mode, options.forcekeep, options.forcedelete, options.dryrun)
+        return (CheckStatus.ALLOK, False, False, removed, report.finish(CheckStatus.ALLOK))
+
+    source = SourceFile(current, options.streamabove is None or path.getsize(current) <= options.streamabove)
+    if source.inmemory:
+        with report.phase("read"):
+            if path.getsize(current) > 0:
+                report.bytes_read += len(source.load())
+
+    with report.phase("check"):
+        status = check_file(options.source, current, source)
+    report.records = len(source.records)
+
+    # Check for errors
+    #
+    if status == CheckStatus.NOSYC: 
+        logwarning("File, %s, failed checking, will not synchronize" % current)
+        report.action = "nosync"
+        return (status, False, False, False, report.finish(status))
+
+    # Synchronize
+    #
+    (merged, copied, removed) = execute_merge(current, options.destination, options.mode, options.forcekeep, options.forcedelete, status == CheckStatus.FORCESORT, options.dryrun, source, options.index, options.journal, report, options.streamabove)
+
+    return (status, merged, copied, removed, report.finish(status))
+
+def init_worker(stopevent):
+    global STOPEVENT
+
+    # Only the main process handles SIGINT, workers just check
+    # the stop event before each file
+    #
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    STOPEVENT = stopevent
+
+def sync_group(args):
+    
+    # Worker: synchronize, in order, all files of one destination.
+    # Log messages are collected and returned to the main process.
+    #
+    (files, options) = args
+
+    results = [ ]
+    buf = StringIO()
+    destination = logger.destination
+    logger.setdestination(buf)
+    try:
+        for current in files:
+            if STOPEVENT is not None and STOPEVENT.is_set():
+                break
+            try:
+                results.append((current,) + sync_file(current, options))
+            except Exception as e:
+                logerror("Uncatch exception: %s" % str(e))
+                results.append((current, None, False, False, False, None))
+    finally:
+        logger.setdestination(destination)
+
+    return (results, buf.getvalue())
+
+def run_parallel(files, options, account):
+    global STOPEVENT
+
+    # Files are consumed lazily, keeping at most 2 x jobs tasks in
+    # flight. A file whose destination is already being processed
+    # waits for that task to finish, so the sources of one destination
+    # are processed in order and never at the same time.
+    #
+    STOPEVENT = multiprocessing.Event()
+    pool = multiprocessing.Pool(options.jobs, init_worker, (STOPEVENT,))
+
+    files = iter(files)
+    inflight = { }   # destination name -> AsyncResult
+    waiting = { }    # destination name -> [ files ]
+    exhausted = False
+
+    def submit(key, group):
+        inflight[key] = pool.apply_async(sync_group, ((group, options),))
+
+    try:
+        while True:
+            while not FORCESTOP and not exhausted and len(inflight) < 2 * options.jobs:
+                try:
+                    current = next(files)
+                except StopIteration:
+                    exhausted = True
+                    break
+                key = path.basename(current)
+                if key in inflight:
+                    waiting.setdefault(key, [ ]).append(current)
+                else:
+                    submit(key, [ current ])
+
+            if not inflight:
+                break
+
+            # Poll, so that SIGINT is handled
+            #
+            done = [ key for key in inflight if inflight[key].ready() ]
+            if not done:
+                time.sleep(0.05)
+                continue
+
+            for key in done:
+                (results, messages) = inflight.pop(key).get()
+                if messages: logger.destination.write(messages)
+                for result in results:
+                    account(*result)
+                if key in waiting and not FORCESTOP:
+                    submit(key, waiting.pop(key))
+    finally:
+        pool.close()
+        pool.join()
+
 def make_cmdline_parser():
     # Create the parser
     #
@@ -354,9 +1236,21 @@ def make_cmdline_parser():
     parser.add_option("-k","--force-keep", action="store_true", dest="forcekeep",
                       help="Force keep, i.e. copy from source SDS files instead of moving/merge when operating in NRT mode.", default=False)
 
+    parser.add_option("-j", "--jobs", type="int", dest="jobs",
+                      help="Number of parallel processes (files of the same destination are always processed in order by one process).", default=1)
+
     parser.add_option("-n", "--dry-run", action="store_true", dest="dryrun",
                       help="Run in Dry mode, i.e. just simulate sincronization performing basic checks", default=False)
 
+    parser.add_option("--no-index", action="store_false", dest="useindex",
+                      help="Do not use (nor update) the destination fingerprint index (%s)." % DestinationIndex.FILENAME, default=True)
+
+    parser.add_option("--stream-above", type="float", dest="streamabove",
+                      help="Merge day files larger than this (source + destination, in MB) record by record, with bounded memory, instead of loading them (default 64, 0 streams always).", default=64.0)
+
+    parser.add_option("-r", "--report", type="string", dest="report",
+                      help="Append a JSON lines run report to this file (- for stdout): one line per file with the time of each phase and a throughput summary line.", default=None)
+
     parser.add_option("-s","--source", type="string", dest="source",
                       help="Source SDS to copy files from. In NRT mode those files will be deleted.", default=None)
 
@@ -425,6 +1319,15 @@ if __name__ == "__main__":
         logerror("Missing basic options, source, destination and mode are needed.")
         stop = True
 
+    if options.jobs < 1:
+        logerror("Invalid number of jobs: %d" % options.jobs)
+        stop = True
+
+    if options.streamabove < 0:
+        logerror("Invalid --stream-above size: %s" % options.streamabove)
+        stop = True
+    options.streamabove = int(options.streamabove * 1024 * 1024)
+
     if args:
         logerror("Invalid options: %s" % args)
         stop = True
@@ -435,60 +1338,80 @@ if __name__ == "__main__":
     if haspostman and options.mailusers:
         logger.setdestination(Postman.getnewmessagebody())
 
-    # Get filelist to sync
+    # Destination fingerprint index (read only in dry mode)
+    #
+    options.index = None
+    if options.useindex and path.isdir(options.destination):
+        options.index = DestinationIndex(options.destination, options.dryrun)
+
+    # Journal of source files done (resume an interrupted run)
     #
-    files = get_filelist(options.source, options.mode)
+    options.journal = Journal(options.source, options.dryrun)
+    if len(options.journal) > 0:
+        logwarning("Resuming an interrupted run, %d files already done" % len(options.journal))
+
+    # Get filelist to sync (lazy, the main loop starts right away)
+    #
+    enumerated = { }
+    files = timed_files(get_filelist(options.source, options.mode), enumerated)
+
+    runreport = RunReport(options.report) if options.report else None
 
     # Catch signal
     signal.signal(signal.SIGINT, signal_handler)
 
     # Main loop
     #
-    nmerged  = 0
-    ncopied  = 0
-    nremoved = 0
-    nerror   = 0
+    counts = { "merged": 0, "copied": 0, "removed": 0, "error": 0, "current": 0 }
 
-    ntotal = len(files)
-    ncurrent = 0
-    for current in files:
-        try:
-            if FORCESTOP:
-                break
+    def account(current, status, merged, copied, removed, report = None):
+        if report is not None:
+            report.phases["enumerate"] += enumerated.pop(current, 0.0)
+            if runreport is not None: runreport.add(report)
+        else:
+            enumerated.pop(current, None)
 
-            # Check the file
-            #
-            status = check_file(options.source, current)
+        if status is None:
+            return
 
-            # Check for errors
-            #
-            if status == CheckStatus.NOSYC: 
-                logwarning("File, %s, failed checking, will not synchronize" % current)
-                nerror += 1
-                continue
+        if status == CheckStatus.NOSYC:
+            counts["error"] += 1
+            return
 
-            # Synchronize
-            #
-            (merged, copied, removed) = execute_merge(current, options.destination, options.mode, options.forcekeep, options.forcedelete, status == CheckStatus.FORCESORT, options.dryrun)
+        loginfo( "[%05d] %s %s%s%s" % (counts["current"] + counts["error"], path.basename(current), "M" if merged else "-",  "C" if copied else "-",  "R" if removed else "-", ) )
 
-            loginfo( "[%05d/%05d] %s %s%s%s" % (ncurrent + nerror, ntotal, path.basename(current), "M" if merged else "-",  "C" if copied else "-",  "R" if removed else "-", ) )
+        counts["current"] += 1
+        if merged: counts["merged"] += 1
+        if copied: counts["copied"] += 1
+        if removed: counts["removed"] += 1
 
-            ncurrent += 1
-            if merged: nmerged+=1
-            if copied: ncopied+=1
-            if removed: nremoved+=1
+    if options.jobs > 1:
+        run_parallel(files, options, account)
+    else:
+        for current in files:
+            try:
+                if FORCESTOP:
+                    break
 
-        except Exception as e:
-            logerror("Uncatch exception: %s" % str(e))
-            continue
+                account(current, *sync_file(current, options))
+
+            except Exception as e:
+                logerror("Uncatch exception: %s" % str(e))
+                continue
 
     if FORCESTOP:
         logwarning("Not all files were processed")
+    else:
+        options.journal.clear()
 
     if options.dryrun:
         logwarning("This was a dry RUN")
 
-    logwarning("Copied: %d Merged: %d Removed: %d Errors: %d" % (ncopied, nmerged, nremoved, nerror))
+    logwarning("Copied: %d Merged: %d Removed: %d Errors: %d" % (counts["copied"], counts["merged"], counts["removed"], counts["error"]))
+
+    if runreport is not None:
+        summary = runreport.close(FORCESTOP)
+        loginfo("%d files in %.1fs (%s files/s, %s MB/s read)" % (summary["files"], summary["wall_s"], summary["files_per_s"], summary["mb_read_per_s"]))
 
     if haspostman and options.mailusers:
         Postman.send(options.mailusers, "SdsMerge run on %s " % (str(UTCDateTime())))
@@ -3,7 +3,8 @@
 ####
 #
 # Indexing script to be executed regularly.
-# Depends on: awk, diff, find, mysql and mysqlimport
+# Depends on: awk, diff, find, mysql, mysqlimport, python (with numpy),
+#             msindex.py and msheader.py (installed in the same folder)
 #
 # Command line option is only:
 #   --luke to remove dead database entries, entries that has no file associated.
@@ -21,6 +22,7 @@ export TABLE="globalsds"             # SQL table to store information (1 per SDS
 export SDS="/SDS/"               # Base SDS folder
 export EXTRASDS=$(cd $SDS && ls -1d  20*/* 2>/dev/null) # Internal SDS folder to scan
 export TEMPDIR="/tmp"
+export MSINDEX="/home/suporte/bin/msindex.py" # SDS file indexer (replaces msi -tf 2 -T)
 
 
 [ ! -d "${TEMPDIR}" ] && mkdir -p ${TEMPDIR}
@@ -29,6 +31,7 @@ export currentlist=$(mktemp -p ${TEMPDIR})  # Support file for current SDS filel
 export sqllist=$(mktemp -p ${TEMPDIR})      # Support file for SQL filelist
 
 [ -z "${MYPASS}" -o -z "${MYUSER}" -o -z "${MYDB}" -o -z "${MYHOST}" ] && echo "FIX ME, need DB parameters." && exit
+[ ! -f "${MSINDEX}" -o ! -f "$(dirname ${MSINDEX})/msheader.py" ] && echo "FIX ME, need msindex.py and msheader.py in $(dirname ${MSINDEX})." && exit
 
 function createtable() {
 	cat << EOF | mysql --protocol TCP --host ${MYHOST} -u${MYUSER} -p${MYPASS} ${MYDB}
@@ -64,23 +67,8 @@ function builddblist() {
 }
 
 function index() {
-	basefilename=$1
-	filename=$SDS/$(echo $1 | awk -F"." '{printf "%04d/%s/%s/%s.%s/%s",$6,$1,$2,$4,"D",$0}')
-	if [ ! -f "$filename" ]; then
-		echo "cannot be found in folder $filename." >&2
-		return 1
-	fi
-	mtime=$(find $filename -printf "%T@" |awk '{print int($1)}')
-
-	/home/suporte/bin/msi -tf 2 -T $filename |\
-	 awk -v filename="$basefilename" -v mtime="$mtime" '{
-	if (NF != 5) next;
-	parts[0]=1;
-	split($1,parts,"_");n=parts[1];s=parts[2];l=parts[3];c=parts[4];
-	ts=$2;te=$3;
-	dt=$4;
-	printf "%s\t%d\t%s.%s.%s.%s\t%f\t%f\t%f\n",filename,mtime,n,s,l,c,ts,te,dt;
-}'
+	# Index all files listed (basenames) on $1, in a single process
+	python ${MSINDEX} -p -s $SDS < $1
 	return 0
 }
 
@@ -137,16 +125,9 @@ function addnew() {
 			did=1
 			echo ""
 			echo "Indexing new files: "
-			total=$(cat $toadd | wc -l)
-			i=1
 			[ -f $importfile ] && rm -f $importfile
 			touch $importfile
-			cat $toadd | while read filename
-			do
-				printf "  [%05d/%05d] %-28s\n" $i $total $filename
-				index $filename >> $importfile
-				i=$(( i + 1 ))
-			done
+			index $toadd 2>&1 >> $importfile
 
 			if [ $(cat $importfile | wc -l) -gt 0 ]; then
 				echo ""